@@ -0,0 +1,377 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import requests
+
+import utils
+from utils import _read_firms_csv, _process_firms_data, load_province_points
+
+# ========== CONFIG ==========
+FIRMS_DIR = "data/firms_archive"
+DATASET_DIR = "data/dataset"
+WEATHER_CACHE_DIR = "data/weather_cache"
+DATA_CSV = "data.csv"
+OPEN_METEO_ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+WEATHER_TIMEOUT = 30
+
+# Open-Meteo daily → tên cột trong data.csv
+WEATHER_VARIABLES = {
+    "temperature_2m_max": "Tmax_C",
+    "temperature_2m_min": "Tmin_C",
+    "relative_humidity_2m_max": "RHmax_pct",
+    "precipitation_sum": "Precip_sum_mm",
+    "wind_speed_10m_max": "Wind_max_kmh",
+    "shortwave_radiation_sum": "Solar_rad_J_m2",
+}
+
+# Nhãn: mọi điểm nóng FIRMS là is_fire=1. Nhãn âm của data.csv không suy ra được
+# từ các trường FIRMS → mẫu âm là bước lấy mẫu riêng, tùy chọn (sample_negative_days)
+NEGATIVE_SEED = 42
+# Thuộc tính điểm nóng của mẫu âm được mượn từ điểm nóng thật (cùng tỉnh, cùng tháng)
+HOTSPOT_COLUMNS = [
+    "latitude_y",
+    "longitude_y",
+    "scan",
+    "track",
+    "acq_time",
+    "satellite",
+    "instrument",
+    "version",
+    "bright_ti5",
+    "frp",
+    "daynight",
+    "type",
+]
+
+# Schema Parquet (cùng tên cột với data.csv để build_model dùng lại được)
+DATASET_DTYPES = {
+    "date": "datetime64[ns]",
+    "Tmax_C": "float32",
+    "Tmin_C": "float32",
+    "RHmax_pct": "float32",
+    "Precip_sum_mm": "float32",
+    "Wind_max_kmh": "float32",
+    "Solar_rad_J_m2": "float32",
+    "province": "string",
+    "latitude_x": "float64",
+    "longitude_x": "float64",
+    "Precip_sum_7d": "float32",
+    "Precip_sum_30d": "float32",
+    "Key": "string",
+    "latitude_y": "float64",
+    "longitude_y": "float64",
+    "scan": "float32",
+    "track": "float32",
+    "acq_time": "float32",
+    "satellite": "string",
+    "instrument": "string",
+    "version": "string",
+    "bright_ti5": "float32",
+    "frp": "float32",
+    "daynight": "string",
+    "type": "float32",
+    "is_fire": "int8",
+}
+
+
+# ========== FIRMS ==========
+def load_firms_archive(firms_dir, since=None):
+    """Đọc mọi CSV FIRMS trong thư mục, gán tỉnh (vector hóa), bỏ ngày <= since"""
+    utils.load_vn_map()
+    frames = []
+    for path in sorted(glob.glob(os.path.join(firms_dir, "*.csv"))):
+        df = _read_firms_csv(path)
+        if since is not None and "acq_date" in df.columns:
+            df = df[df["acq_date"] > since.strftime("%Y-%m-%d")]
+        if not df.empty:
+            print(f"📂 {os.path.basename(path)}: {len(df)} detections")
+            frames.append(df)
+
+    if not frames:
+        return utils._empty_firms_frame()
+
+    return _process_firms_data(pd.concat(frames, ignore_index=True))
+
+
+# ========== WEATHER ==========
+def _weather_cache_path(cache_dir, lat, lon, year):
+    return os.path.join(cache_dir, f"{lat:.4f}_{lon:.4f}_{year}.json")
+
+
+def _cache_covers(daily, year, today):
+    """Cache năm `year` đã có tới ngày cuối cần (31/12 hoặc hôm nay)"""
+    times = daily.get("time") or []
+    end = min(date(year, 12, 31), today)
+    return bool(times) and times[-1] >= end.strftime("%Y-%m-%d")
+
+
+def fetch_weather_year(lat, lon, year, cache_dir, offline=False):
+    """
+    Thời tiết ngày của 1 điểm trong 1 năm, qua cache trên đĩa
+
+    Cache dùng lại khi đã phủ tới min(31/12, hôm nay) hoặc mới tải < 1 ngày
+    (archive trễ vài ngày). Cache ghi lúc năm chưa hết (vd. 2025 lưu ngày
+    15/12/2025) dừng sớm hơn → tải lại, không để điểm nóng sau đó bị rơi khỏi join.
+    """
+    path = _weather_cache_path(cache_dir, lat, lon, year)
+    today = date.today()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            daily = json.load(f)
+        recent = time.time() - os.path.getmtime(path) < 86400
+        if offline or recent or _cache_covers(daily, year, today):
+            return daily
+
+    if offline:
+        raise FileNotFoundError(f"Weather cache missing (offline): {path}")
+
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "start_date": f"{year}-01-01",
+        "end_date": min(date(year, 12, 31), today).strftime("%Y-%m-%d"),
+        "daily": list(WEATHER_VARIABLES),
+        "timezone": "Asia/Ho_Chi_Minh",
+    }
+    resp = requests.get(OPEN_METEO_ARCHIVE_URL, params=params, timeout=WEATHER_TIMEOUT)
+    resp.raise_for_status()
+    daily = resp.json().get("daily", {})
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(daily, f)
+    os.replace(tmp, path)
+    return daily
+
+
+def load_weather(points, start, end, cache_dir, workers=8, offline=False):
+    """
+    Thời tiết ngày theo tỉnh từ (start - 30 ngày) đến end, tải song song
+
+    Precip_sum_7d / Precip_sum_30d là tổng trượt (gồm cả ngày hiện tại).
+    """
+    first = start - timedelta(days=30)
+    tasks = [
+        (province, lat, lon, year)
+        for province, (lat, lon) in points.items()
+        for year in range(first.year, end.year + 1)
+    ]
+
+    def fetch(task):
+        province, lat, lon, year = task
+        daily = fetch_weather_year(lat, lon, year, cache_dir, offline)
+        df = pd.DataFrame(daily).rename(columns=WEATHER_VARIABLES)
+        df["province"] = province
+        df["latitude_x"] = lat
+        df["longitude_x"] = lon
+        return df
+
+    print(f"🌦️ Weather: {len(tasks)} province-years ({workers} threads)")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = list(pool.map(fetch, tasks))
+
+    weather = pd.concat(frames, ignore_index=True)
+    weather["date"] = pd.to_datetime(weather.pop("time"))
+    weather = weather.sort_values(["province", "date"]).reset_index(drop=True)
+
+    precip = weather.groupby("province")["Precip_sum_mm"]
+    for days in (7, 30):
+        weather[f"Precip_sum_{days}d"] = precip.transform(
+            lambda s: s.fillna(0).rolling(days, min_periods=1).sum()
+        )
+
+    in_range = (weather["date"] >= pd.Timestamp(start)) & (
+        weather["date"] <= pd.Timestamp(end)
+    )
+    return weather.loc[in_range]
+
+
+def _borrow_detections(negatives, hotspots, rng):
+    """
+    Thuộc tính điểm nóng cho mẫu âm: bốc ngẫu nhiên 1 điểm nóng thật
+    cùng tỉnh + cùng tháng (không có → cùng tháng → bất kỳ)
+    """
+    columns = [c for c in HOTSPOT_COLUMNS if c in hotspots.columns]
+    donors = hotspots[columns].reset_index(drop=True)
+    donor_province = hotspots["province"].to_numpy()
+    donor_month = hotspots["date"].dt.month.to_numpy()
+
+    picks = np.empty(len(negatives), dtype="int64")
+    month = negatives["date"].dt.month.to_numpy()
+    groups = pd.DataFrame(
+        {"province": negatives["province"].to_numpy(), "month": month}
+    )
+    for (province, m), rows in groups.groupby(["province", "month"]).indices.items():
+        pool = np.flatnonzero((donor_province == province) & (donor_month == m))
+        if not len(pool):
+            pool = np.flatnonzero(donor_month == m)
+        if not len(pool):
+            pool = np.arange(len(donors))
+        picks[rows] = rng.choice(pool, size=len(rows))
+
+    borrowed = donors.iloc[picks].set_index(negatives.index)
+    return negatives.assign(**{c: borrowed[c] for c in columns})
+
+
+def sample_negative_days(weather, hotspots, ratio, seed=NEGATIVE_SEED):
+    """
+    Mẫu âm (is_fire=0) cho build_model: các tỉnh-ngày KHÔNG có điểm nóng nào
+
+    - Lấy ngẫu nhiên (seed cố định) tối đa ratio × số điểm nóng
+    - Thời tiết là của chính tỉnh-ngày đó; frp, bright_ti5, scan, track,
+      daynight... mượn từ điểm nóng thật cùng tỉnh / mùa (_borrow_detections)
+      → không để trống, vì build_model fillna(0) sẽ biến ô trống thành
+      dấu hiệu lộ nhãn mà lúc suy luận không bao giờ có
+    """
+    fire_days = pd.MultiIndex.from_frame(hotspots[["province", "date"]])
+    days = pd.MultiIndex.from_frame(weather[["province", "date"]])
+    candidates = weather.loc[~days.isin(fire_days)]
+
+    n = min(len(candidates), int(round(ratio * len(hotspots))))
+    negatives = candidates.sample(n=n, random_state=seed)
+    negatives = _borrow_detections(negatives, hotspots, np.random.default_rng(seed))
+    negatives["is_fire"] = 0
+    print(f"➖ Negatives: {n} of {len(candidates)} province-days without detections")
+    return negatives
+
+
+# ========== DATASET ==========
+def _last_built_date(out_dir):
+    """Ngày mới nhất đã có trong dataset (None nếu chưa có)"""
+    parts = glob.glob(os.path.join(out_dir, "*.parquet"))
+    if not parts:
+        return None
+    dates = pd.concat(pd.read_parquet(p, columns=["date"]) for p in parts)
+    return dates["date"].max().date()
+
+
+def build_dataset(
+    firms_dir=FIRMS_DIR,
+    out_dir=DATASET_DIR,
+    cache_dir=WEATHER_CACHE_DIR,
+    workers=8,
+    offline=False,
+    full=False,
+    negatives=None,
+):
+    """
+    FIRMS archive + thời tiết ngày + tỉnh GADM → dataset Parquet (mỗi lần chạy 1 part)
+
+    Chạy lại chỉ xử lý các ngày mới hơn ngày cuối cùng đã có (trừ khi full=True).
+    Mọi điểm nóng là is_fire=1; negatives (tỉ lệ mẫu âm / điểm nóng) bật thêm
+    bước sample_negative_days, None → dataset chỉ có mẫu dương.
+    """
+    if full:
+        for part in glob.glob(os.path.join(out_dir, "part-*.parquet")):
+            os.remove(part)
+
+    since = None if full else _last_built_date(out_dir)
+    if since:
+        print(f"♻️ Incremental: only days after {since}")
+
+    hotspots = load_firms_archive(firms_dir, since=since)
+    hotspots = hotspots.loc[hotspots["province"] != "Unknown"].reset_index(drop=True)
+    if hotspots.empty:
+        print("ℹ️ No new detections")
+        return None
+
+    hotspots["date"] = pd.to_datetime(hotspots["acq_date"])
+    hotspots["is_fire"] = 1
+
+    points = load_province_points(DATA_CSV)
+    missing = sorted(set(hotspots["province"]) - set(points))
+    if missing:
+        print(f"⚠️ No weather point for {missing}, dropping their rows")
+        hotspots = hotspots.loc[hotspots["province"].isin(points)]
+
+    # Mẫu âm lấy từ mọi tỉnh có điểm thời tiết, không chỉ tỉnh có điểm nóng
+    provinces = set(points) if negatives else set(hotspots["province"])
+    start, end = hotspots["date"].min().date(), hotspots["date"].max().date()
+    weather = load_weather(
+        {p: xy for p, xy in points.items() if p in provinces},
+        start,
+        end,
+        cache_dir,
+        workers=workers,
+        offline=offline,
+    )
+
+    hotspots = hotspots.rename(
+        columns={"latitude": "latitude_y", "longitude": "longitude_y"}
+    )
+    df = hotspots.merge(weather, on=["province", "date"], how="inner")
+    if negatives:
+        df = pd.concat(
+            [df, sample_negative_days(weather, hotspots, negatives)],
+            ignore_index=True,
+        )
+    df["Key"] = df["province"] + "_" + df["date"].dt.strftime("%Y-%m-%d")
+
+    for col in DATASET_DTYPES:
+        if col not in df.columns:
+            df[col] = np.nan
+    df = df[list(DATASET_DTYPES)].astype(DATASET_DTYPES)
+    df = df.sort_values(["province", "date", "acq_time"]).reset_index(drop=True)
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"part-{start:%Y%m%d}-{end:%Y%m%d}.parquet")
+    df.to_parquet(path, index=False)
+
+    print(
+        f"✅ {len(df)} rows ({int(df['is_fire'].sum())} fires) "
+        f"{start} → {end} written to {path}"
+    )
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Dựng dataset huấn luyện (FIRMS + thời tiết + tỉnh) dạng Parquet"
+    )
+    parser.add_argument("--firms-dir", default=FIRMS_DIR)
+    parser.add_argument("--out", default=DATASET_DIR)
+    parser.add_argument("--weather-cache", default=WEATHER_CACHE_DIR)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--offline", action="store_true", help="Chỉ dùng cache thời tiết trên đĩa"
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="Dựng lại toàn bộ (bỏ qua incremental)"
+    )
+    parser.add_argument(
+        "--negatives",
+        type=float,
+        default=None,
+        metavar="RATIO",
+        help="Thêm mẫu âm: RATIO × số điểm nóng tỉnh-ngày không có điểm nóng "
+        "(thuộc tính điểm nóng mượn từ điểm thật cùng tỉnh / tháng), cần cho "
+        "build_model. Mặc định: không sinh, dataset chỉ có mẫu dương",
+    )
+    parser.add_argument("--csv", default=None, help="Xuất thêm toàn bộ dataset ra CSV")
+    args = parser.parse_args()
+
+    build_dataset(
+        firms_dir=args.firms_dir,
+        out_dir=args.out,
+        cache_dir=args.weather_cache,
+        workers=args.workers,
+        offline=args.offline,
+        full=args.full,
+        negatives=args.negatives,
+    )
+
+    if args.csv and glob.glob(os.path.join(args.out, "*.parquet")):
+        pd.read_parquet(args.out).to_csv(args.csv, index=False)
+        print(f"📝 CSV exported: {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,11 @@ os.makedirs(MODEL_DIR, exist_ok=True)
 def load_and_prepare_data(filepath):
     """Load data và chuẩn bị như notebook"""
     print(f"📂 Đang đọc dữ liệu từ {filepath}...")
-    df = pd.read_csv(filepath)
+    if os.path.isdir(filepath) or filepath.endswith(".parquet"):
+        # Dataset Parquet từ build_dataset.py
+        df = pd.read_parquet(filepath)
+    else:
+        df = pd.read_csv(filepath)
 
     # Đổi tên cột nếu cần (khớp notebook)
     if "latitude_x" in df.columns:
@@ -39,7 +43,7 @@ def load_and_prepare_data(filepath):
         df["day_cos"] = np.cos(2 * np.pi * df["day_of_year"] / 365)
 
     # Map daynight
-    if "daynight" in df.columns and df["daynight"].dtype == "object":
+    if "daynight" in df.columns and not pd.api.types.is_numeric_dtype(df["daynight"]):
         df["daynight"] = df["daynight"].map({"D": 1, "N": 0})
 
     return df
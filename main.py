@@ -1,4 +1,5 @@
 import joblib
+import numpy as np
 import pandas as pd
 import uvicorn
 import os
@@ -6,19 +7,31 @@ from datetime import datetime, timedelta
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional
 from utils import (
     preprocess_input,
-    crawl_firms_realtime,
-    crawl_firms_historical,
-    get_weather_daily,
+    preprocess_batch,
+    explain_batch,
+    model_version,
+    get_firms_hotspots,
+    get_weather_with_meta,
+    get_weather_forecast,
+    load_province_points,
+    UpstreamUnavailable,
     get_province_from_latlon,
+    hotspots_to_records,
+    get_hotspot_index,
+    query_nearby_hotspots,
+    nearby_fire_stats,
 )
+from stats_cube import build_stats_cube, query_stats_cube
 
 # ========== CONFIG ==========
 MODEL_PATH = "model/fire_risk_best_model.pkl"
 PREPROC_PATH = "model/preprocessor.pkl"
 DATA_CSV = "data.csv"
+HOTSPOT_ARCHIVE_DIR = os.getenv("HOTSPOT_ARCHIVE_DIR", "data/firms_archive")
 
 app = FastAPI(title="Fire Risk Warning System")
 
@@ -30,22 +43,29 @@ app.add_middleware(
 )
 
 model = None
+model_tag = None
 preprocessors = {}
+stats_cube = None
+province_points = {}
 
 
 @app.on_event("startup")
 def startup_event():
-    global model, preprocessors
+    global model, model_tag, preprocessors, stats_cube, province_points
     if not os.path.exists(MODEL_PATH):
         raise FileNotFoundError(
             f"❌ Model not found: {MODEL_PATH}. Run build_model.py first!"
         )
 
     model = joblib.load(MODEL_PATH)
+    model_tag = model_version(MODEL_PATH)
     preprocessors = joblib.load(PREPROC_PATH)
     print("✅ Model & Preprocessors Loaded")
     print(f"📋 Expected features: {preprocessors.get('expected_columns', [])}")
 
+    stats_cube = build_stats_cube(DATA_CSV, HOTSPOT_ARCHIVE_DIR)
+    province_points = load_province_points(DATA_CSV)
+
 
 # ========== PYDANTIC MODELS ==========
 class PredictInput(BaseModel):
@@ -71,6 +91,25 @@ class MapPoint(BaseModel):
     lon: float
 
 
+class ClickPoint(MapPoint):
+    use_nearby: bool = False  # Dùng điểm nóng lân cận làm ngữ cảnh
+    nearby_radius_km: float = Field(10.0, gt=0, le=500)
+    forecast_days: int = Field(0, ge=0, le=16)  # 0 = chỉ hôm nay
+
+
+class NearbyQuery(BaseModel):
+    points: List[MapPoint]
+    k: Optional[int] = Field(5, ge=1, le=1000)
+    radius_km: Optional[float] = Field(None, gt=0, le=500)
+
+    @model_validator(mode="after")
+    def _k_or_radius(self):
+        # k=None chỉ hợp lệ khi lọc theo bán kính (lấy mọi điểm trong radius_km)
+        if self.k is None and self.radius_km is None:
+            raise ValueError("k is required when radius_km is not set")
+        return self
+
+
 class HotspotPoint(BaseModel):
     lat: float
     lon: float
@@ -81,6 +120,11 @@ class HotspotPoint(BaseModel):
     track: float
 
 
+class ExplainBatch(BaseModel):
+    inputs: List[PredictInput] = Field(..., min_length=1, max_length=100_000)
+    top_k: Optional[int] = Field(None, ge=1)  # Chỉ trả k feature ảnh hưởng nhất
+
+
 # ========== API ENDPOINTS ==========
 @app.post("/api/predict")
 def predict_manual(data: PredictInput):
@@ -103,31 +147,119 @@ def predict_manual(data: PredictInput):
         raise HTTPException(500, f"Prediction error: {str(e)}")
 
 
+def _explain(inputs, top_k=None):
+    """Dự báo + SHAP cho 1 lô input (1 lần preprocess, 1 lần predict, 1 lần SHAP)"""
+    X = preprocess_batch(
+        pd.DataFrame([i.dict() for i in inputs]), preprocessors
+    ).reset_index(drop=True)
+    probs = model.predict_proba(X)[:, 1]
+    contributions, base_values = explain_batch(model, X, model_tag)
+
+    # Sắp feature theo |đóng góp| giảm dần (vector hóa cho cả lô)
+    names = contributions.columns.to_numpy()
+    values = contributions.to_numpy()
+    order = np.argsort(-np.abs(values), axis=1)[:, :top_k]
+
+    results = []
+    for prob, base, idx, row in zip(probs, base_values, order, values):
+        results.append(
+            {
+                "probability": round(float(prob), 4),
+                "risk_level": (
+                    "Nguy cơ Rất Cao"
+                    if prob > 0.8
+                    else ("Cao" if prob > 0.5 else "Thấp")
+                ),
+                "is_fire": bool(prob > 0.5),
+                "base_value": float(base),
+                "contributions": dict(
+                    zip(names[idx].tolist(), row[idx].round(6).tolist())
+                ),
+            }
+        )
+    return results
+
+
+@app.post("/api/explain")
+def explain_prediction(data: PredictInput):
+    """Giải thích dự báo: đóng góp SHAP (log-odds) của từng feature"""
+    if not model:
+        raise HTTPException(500, "Model not ready")
+
+    try:
+        return {"model_version": model_tag, **_explain([data])[0]}
+    except Exception as e:
+        raise HTTPException(500, f"Explain error: {str(e)}")
+
+
+@app.post("/api/explain/batch")
+def explain_batch_predictions(batch: ExplainBatch):
+    """Giải thích cả lô (vd. mọi điểm nóng trong ngày) trong 1 lần gọi SHAP"""
+    if not model:
+        raise HTTPException(500, "Model not ready")
+
+    try:
+        results = _explain(batch.inputs, batch.top_k)
+        return {"model_version": model_tag, "count": len(results), "results": results}
+    except Exception as e:
+        raise HTTPException(500, f"Explain error: {str(e)}")
+
+
 @app.get("/api/stats")
 def get_stats():
-    """Thống kê từ file CSV"""
-    if not os.path.exists(DATA_CSV):
+    """Thống kê từ file CSV (đọc từ cube, không quét lại dữ liệu thô)"""
+    if stats_cube is None or stats_cube.empty:
         return {"heatmap": {}, "monthly": {}, "total_fires": 0}
 
-    df = pd.read_csv(DATA_CSV)
-    df_fire = df[df["is_fire"] == 1]
+    fires = {"is_fire": 1, "sources": ["dataset"]}
 
     # Heatmap theo tỉnh
-    heatmap_data = df_fire["province"].value_counts().head(20).to_dict()
+    by_province = query_stats_cube(stats_cube, group_by=["province"], **fires)
+    top = sorted(by_province["groups"], key=lambda g: g["count"], reverse=True)[:20]
+    heatmap_data = {g["province"]: g["count"] for g in top}
 
     # Monthly distribution
-    if "date" in df.columns:
-        df["date"] = pd.to_datetime(df["date"])
-        month_data = (
-            df[df["is_fire"] == 1]["date"]
-            .dt.month.value_counts()
-            .sort_index()
-            .to_dict()
-        )
-    else:
-        month_data = {}
+    by_month = query_stats_cube(stats_cube, group_by=["month"], **fires)
+    month_data = {g["month"]: g["count"] for g in by_month["groups"]}
+
+    return {
+        "heatmap": heatmap_data,
+        "monthly": month_data,
+        "total_fires": by_province["total"],
+    }
+
+
+@app.get("/api/stats/query")
+def query_stats(
+    start: Optional[str] = Query(None, description="Tháng đầu, YYYY-MM (bao gồm)"),
+    end: Optional[str] = Query(None, description="Tháng cuối, YYYY-MM (bao gồm)"),
+    province: Optional[List[str]] = Query(None),
+    group_by: List[str] = Query(["province"]),
+    is_fire: Optional[int] = Query(None, ge=0, le=1),
+    daynight: Optional[str] = Query(None, pattern="^[DN]$"),
+    source: Optional[List[str]] = Query(None, description="dataset / archive"),
+):
+    """
+    Truy vấn thống kê từ cube tiền tổng hợp
+    - Lọc theo khoảng tháng (YYYY-MM, ngày cụ thể → 400), tỉnh, is_fire, ngày/đêm, nguồn
+    - group_by: province, year, month, daynight, is_fire, source
+    """
+    if stats_cube is None:
+        raise HTTPException(503, "Stats cube not ready")
 
-    return {"heatmap": heatmap_data, "monthly": month_data, "total_fires": len(df_fire)}
+    try:
+        return query_stats_cube(
+            stats_cube,
+            start=start,
+            end=end,
+            provinces=province,
+            group_by=group_by,
+            is_fire=is_fire,
+            daynight=daynight,
+            sources=source,
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
 
 
 @app.get("/api/realtime/hotspots")
@@ -144,45 +276,93 @@ def get_realtime_data(
     - days=365: 1 năm qua
     """
     try:
-        if days == 1:
-            # Realtime today
-            data = crawl_firms_realtime()
-        else:
-            # Historical data
-            data = crawl_firms_historical(days)
-
-        features = [
-            {
-                "lat": row.get("latitude"),
-                "lon": row.get("longitude"),
-                "bright": row.get("bright_ti4", 300),
-                "bright_ti5": row.get("bright_ti5", 295),
-                "frp": row.get("frp", 5.0),
-                "province": row.get("province", "Unknown"),
-                "acq_date": row.get("acq_date", ""),
-                "acq_time": row.get("acq_time", 1200),
-                "scan": row.get("scan", 0.5),
-                "track": row.get("track", 0.5),
-            }
-            for row in data
-        ]
+        # Realtime (days=1) hoặc lịch sử, qua cache stale-while-revalidate
+        data, meta = get_firms_hotspots(days)
+
+        features = hotspots_to_records(data)
 
-        return {"data": features, "count": len(features), "days": days}
+        return {
+            "data": features,
+            "count": len(features),
+            "days": days,
+            "stale": meta["stale"],
+            "age_s": meta["age_s"],
+            "missing_sources": meta["missing"],
+        }
+    except UpstreamUnavailable as e:
+        raise HTTPException(503, f"FIRMS unavailable: {str(e)}")
     except Exception as e:
         raise HTTPException(500, f"FIRMS API error: {str(e)}")
 
 
+@app.post("/api/realtime/nearby")
+def get_nearby_hotspots(query: NearbyQuery):
+    """
+    Điểm nóng lân cận cho 1 hoặc nhiều điểm
+    - radius_km: mọi điểm nóng trong bán kính (tối đa k)
+    - không có radius_km: k điểm nóng gần nhất
+    """
+    try:
+        index = get_hotspot_index()
+        nearby = query_nearby_hotspots(
+            index,
+            [p.lat for p in query.points],
+            [p.lon for p in query.points],
+            k=query.k,
+            radius_km=query.radius_km,
+        )
+
+        return {
+            "results": [
+                {"lat": p.lat, "lon": p.lon, "hotspots": hotspots_to_records(hits)}
+                for p, hits in zip(query.points, nearby)
+            ],
+            "snapshot_size": len(index["df"]),
+            "snapshot_time": datetime.fromtimestamp(index["built_at"]).isoformat(),
+        }
+    except UpstreamUnavailable as e:
+        raise HTTPException(503, f"FIRMS unavailable: {str(e)}")
+    except Exception as e:
+        raise HTTPException(500, f"Nearby query error: {str(e)}")
+
+
+def _forecast(base_input, weather_days):
+    """Chấm điểm mọi ngày trong horizon bằng 1 lần predict_proba"""
+    if weather_days.empty:
+        return []
+
+    rows = pd.DataFrame([base_input] * len(weather_days))
+    weather = weather_days.reset_index(drop=True)
+    rows[weather.columns] = weather
+
+    X = preprocess_batch(rows, preprocessors, dates=weather_days.index)
+    probs = model.predict_proba(X)[:, 1]
+
+    return [
+        {
+            "date": day.strftime("%Y-%m-%d"),
+            "weather": {k: float(v) for k, v in w.items()},
+            "probability": round(float(prob), 4),
+            "risk_level": (
+                "Nguy cơ Rất Cao" if prob > 0.8 else ("Cao" if prob > 0.5 else "Thấp")
+            ),
+            "is_fire": bool(prob > 0.5),
+        }
+        for day, prob, w in zip(
+            weather_days.index, probs, weather.to_dict(orient="records")
+        )
+    ]
+
+
 @app.post("/api/realtime/predict-click")
-def predict_map_click(point: MapPoint):
+def predict_map_click(point: ClickPoint):
     """
     Dự báo khi click vào vị trí KHÔNG có điểm nóng
-    (Giả định môi trường bình thường)
+    (Giả định môi trường bình thường, hoặc dùng điểm nóng lân cận nếu use_nearby)
     """
     try:
         # 1. Lấy thời tiết
-        weather = get_weather_daily(point.lat, point.lon)
-        if not weather:
-            raise HTTPException(500, "Weather API Error")
+        weather, weather_meta = get_weather_with_meta(point.lat, point.lon)
 
         # 2. Xác định tỉnh
         province_name = get_province_from_latlon(point.lat, point.lon)
@@ -200,12 +380,51 @@ def predict_map_click(point: MapPoint):
             "track": 0.5,
         }
 
-        X_proc = preprocess_input(fake_input, preprocessors)
-        prob = model.predict_proba(X_proc)[0][1]
-
-        return {
+        # 4. (Tuỳ chọn) Ngữ cảnh từ điểm nóng lân cận thay cho giá trị giả định
+        #    FIRMS lỗi → bỏ qua ngữ cảnh, giữ giá trị giả định (không làm hỏng dự báo)
+        nearby = None
+        if point.use_nearby:
+            try:
+                index = get_hotspot_index()
+            except UpstreamUnavailable:
+                nearby = {"available": False}
+            else:
+                hits = query_nearby_hotspots(
+                    index,
+                    [point.lat],
+                    [point.lon],
+                    k=None,
+                    radius_km=point.nearby_radius_km,
+                )[0]
+                nearby = {"available": True, **nearby_fire_stats(hits)}
+            if nearby.get("count"):
+                fake_input.update(
+                    {
+                        "frp": nearby["frp_mean"],
+                        "bright_ti5": nearby["bright_ti5_mean"],
+                        "scan": nearby["scan_mean"],
+                        "track": nearby["track_mean"],
+                    }
+                )
+
+        # 5. Dự báo nhiều ngày: cùng chuỗi thời tiết đã cache, 1 lần gọi model
+        forecast = None
+        if point.forecast_days:
+            weather_days, _ = get_weather_forecast(
+                point.lat, point.lon, point.forecast_days
+            )
+            forecast = _forecast(fake_input, weather_days)
+            prob = forecast[0]["probability"] if forecast else None
+
+        if not forecast:
+            X_proc = preprocess_input(fake_input, preprocessors)
+            prob = model.predict_proba(X_proc)[0][1]
+
+        result = {
             "type": "environment",
             "weather": weather,
+            "weather_stale": weather_meta["stale"],
+            "weather_age_s": weather_meta["age_s"],
             "province": province_name,
             "probability": round(float(prob), 4),
             "risk_level": (
@@ -213,6 +432,56 @@ def predict_map_click(point: MapPoint):
             ),
             "is_fire": bool(prob > 0.5),
         }
+        if nearby is not None:
+            result["nearby"] = {"radius_km": point.nearby_radius_km, **nearby}
+        if forecast is not None:
+            result["forecast"] = forecast
+
+        return result
+    except UpstreamUnavailable as e:
+        raise HTTPException(503, f"Upstream unavailable: {str(e)}")
+    except Exception as e:
+        raise HTTPException(500, f"Prediction error: {str(e)}")
+
+
+@app.get("/api/province/forecast")
+def forecast_province(
+    province: str = Query(..., description="Tên tỉnh (như trong data.csv / GADM)"),
+    days: int = Query(7, ge=1, le=16, description="Số ngày dự báo"),
+):
+    """
+    Dự báo nguy cơ cháy nhiều ngày cho 1 tỉnh
+    (Giả định môi trường bình thường tại điểm thời tiết của tỉnh)
+    """
+    if not model:
+        raise HTTPException(500, "Model not ready")
+    if province not in province_points:
+        raise HTTPException(404, f"Unknown province: {province}")
+
+    lat, lon = province_points[province]
+    try:
+        weather_days, weather_meta = get_weather_forecast(lat, lon, days)
+        base_input = {
+            "province": province,
+            "latitude": lat,
+            "longitude": lon,
+            "frp": 5.0,
+            "bright_ti5": 310.0,
+            "daynight": 1,
+            "scan": 0.5,
+            "track": 0.5,
+        }
+
+        return {
+            "province": province,
+            "lat": lat,
+            "lon": lon,
+            "weather_stale": weather_meta["stale"],
+            "weather_age_s": weather_meta["age_s"],
+            "forecast": _forecast(base_input, weather_days),
+        }
+    except UpstreamUnavailable as e:
+        raise HTTPException(503, f"Upstream unavailable: {str(e)}")
     except Exception as e:
         raise HTTPException(500, f"Prediction error: {str(e)}")
 
@@ -225,9 +494,7 @@ def predict_hotspot(point: HotspotPoint):
     """
     try:
         # 1. Lấy thời tiết
-        weather = get_weather_daily(point.lat, point.lon)
-        if not weather:
-            raise HTTPException(500, "Weather API Error")
+        weather, weather_meta = get_weather_with_meta(point.lat, point.lon)
 
         # 2. Xác định tỉnh
         province_name = get_province_from_latlon(point.lat, point.lon)
@@ -255,6 +522,8 @@ def predict_hotspot(point: HotspotPoint):
         return {
             "type": "hotspot",
             "weather": weather,
+            "weather_stale": weather_meta["stale"],
+            "weather_age_s": weather_meta["age_s"],
             "province": province_name,
             "probability": round(float(prob), 4),
             "risk_level": (
@@ -267,6 +536,8 @@ def predict_hotspot(point: HotspotPoint):
                 "time": point.acq_time,
             },
         }
+    except UpstreamUnavailable as e:
+        raise HTTPException(503, f"Upstream unavailable: {str(e)}")
     except Exception as e:
         raise HTTPException(500, f"Prediction error: {str(e)}")
 
@@ -0,0 +1,176 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from utils import preprocess_batch
+
+# ========== CONFIG ==========
+MODEL_PATH = "model/fire_risk_best_model.pkl"
+PREPROC_PATH = "model/preprocessor.pkl"
+CHUNK_SIZE = 100_000
+
+# Đổi tên cột giống build_model.load_and_prepare_data (data.csv)
+RENAME_COLUMNS = {"latitude_x": "latitude", "longitude_x": "longitude"}
+DATE_COLUMNS = ["date", "acq_date"]
+
+# Model nạp 1 lần cho mỗi process worker
+_model = None
+_preprocessors = None
+
+
+def _init_worker(model_path, preproc_path):
+    """Nạp model & preprocessors trong process worker"""
+    global _model, _preprocessors
+    _model = joblib.load(model_path)
+    _preprocessors = joblib.load(preproc_path)
+
+
+def _risk_level(prob):
+    """Mức nguy cơ giống API (vector hóa)"""
+    return np.select(
+        [prob > 0.8, prob > 0.5], ["Nguy cơ Rất Cao", "Cao"], default="Thấp"
+    )
+
+
+def score_chunk(df):
+    """Preprocess + predict_proba cho 1 chunk (chạy trong worker)"""
+    df = df.rename(columns=RENAME_COLUMNS)
+
+    # Ngày của từng dòng cho day_sin/day_cos (không dùng datetime.now())
+    date_col = next((c for c in DATE_COLUMNS if c in df.columns), None)
+    dates = df[date_col] if date_col else None
+
+    # Giữ nguyên NaN: CatBoost tự xử lý giá trị thiếu
+    features = df.drop(columns=["is_fire"], errors="ignore")
+    X = preprocess_batch(features, _preprocessors, dates=dates)
+    prob = _model.predict_proba(X)[:, 1]
+
+    out = df.copy()
+    out["probability"] = prob.round(4)
+    out["risk_level"] = _risk_level(prob)
+    return out
+
+
+def iter_chunks(path, chunksize):
+    """Đọc CSV / Parquet theo chunk"""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+class ChunkWriter:
+    """Ghi kết quả từng chunk ra CSV / Parquet (không giữ toàn bộ trong RAM)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self._writer = None
+        self._first = True
+
+    def write(self, df):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            df.to_csv(
+                self.path,
+                mode="w" if self._first else "a",
+                header=self._first,
+                index=False,
+            )
+        self._first = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def score_file(
+    input_path,
+    output_path,
+    chunksize=CHUNK_SIZE,
+    workers=None,
+    model_path=MODEL_PATH,
+    preproc_path=PREPROC_PATH,
+):
+    """
+    Chấm điểm file lớn theo chunk trên process pool
+
+    Tối đa 2 × workers chunk đang xử lý cùng lúc → RAM bị chặn trên,
+    kết quả ghi ra theo đúng thứ tự đầu vào.
+    """
+    workers = workers or os.cpu_count() or 1
+    writer = ChunkWriter(output_path)
+    pending = deque()
+    total = 0
+    start = time.perf_counter()
+
+    def drain_one():
+        nonlocal total
+        scored = pending.popleft().result()
+        writer.write(scored)
+        total += len(scored)
+        elapsed = time.perf_counter() - start
+        print(f"⚡ {total:,} rows | {total / elapsed:,.0f} rows/s")
+
+    print(f"📂 Scoring {input_path} → {output_path} ({workers} workers)")
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(model_path, preproc_path),
+        ) as pool:
+            for chunk in iter_chunks(input_path, chunksize):
+                pending.append(pool.submit(score_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    drain_one()
+            while pending:
+                drain_one()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"✅ Scored {total:,} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+    return {"rows": total, "seconds": elapsed, "rows_per_s": rate}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Chấm điểm nguy cơ cháy cho file lịch sử lớn (CSV / Parquet)"
+    )
+    parser.add_argument("input", help="File đầu vào .csv hoặc .parquet")
+    parser.add_argument("output", help="File kết quả .csv hoặc .parquet")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--preprocessor", default=PREPROC_PATH)
+    args = parser.parse_args()
+
+    score_file(
+        args.input,
+        args.output,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        model_path=args.model,
+        preproc_path=args.preprocessor,
+    )
+
+
+if __name__ == "__main__":
+    main()
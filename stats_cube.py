@@ -0,0 +1,150 @@
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils import _read_firms_csv, _process_firms_data, load_vn_map
+
+# ========== CONFIG ==========
+CUBE_DIMENSIONS = ["source", "province", "year", "month", "daynight", "is_fire"]
+PERIOD_PATTERN = re.compile(r"(\d{4})-(\d{2})")
+
+
+def _cube_from_rows(dates, province, daynight, is_fire, source):
+    """Gom các cột (cùng độ dài) thành cube đếm"""
+    dates = pd.to_datetime(pd.Series(dates), errors="coerce")
+    rows = pd.DataFrame(
+        {
+            "source": source,
+            "province": pd.Series(province).fillna("Unknown").to_numpy(),
+            "year": dates.dt.year.to_numpy(),
+            "month": dates.dt.month.to_numpy(),
+            "daynight": pd.Series(daynight).astype(object).fillna("D").to_numpy(),
+            "is_fire": np.asarray(is_fire, dtype="int64"),
+        }
+    )
+    rows = rows.dropna(subset=["year", "month"])
+
+    return rows.groupby(CUBE_DIMENSIONS, observed=True).size().rename("count")
+
+
+def _load_dataset_rows(csv_path):
+    """data.csv → cube (chỉ đọc 4 cột cần thiết)"""
+    df = pd.read_csv(csv_path, usecols=["date", "province", "daynight", "is_fire"])
+    return _cube_from_rows(
+        df["date"], df["province"], df["daynight"], df["is_fire"], "dataset"
+    )
+
+
+def _load_archive_rows(archive_dir):
+    """CSV lưu trữ FIRMS (mỗi dòng là 1 điểm nóng) → cube"""
+    load_vn_map()
+    parts = []
+    for path in sorted(glob.glob(os.path.join(archive_dir, "*.csv"))):
+        df = _process_firms_data(_read_firms_csv(path))
+        if df.empty:
+            continue
+
+        if "daynight" in df.columns:
+            daynight = df["daynight"]
+        else:
+            daynight = np.full(len(df), "D", dtype=object)
+        is_fire = np.ones(len(df), dtype="int64")
+        parts.append(
+            _cube_from_rows(
+                df["acq_date"], df["province"], daynight, is_fire, "archive"
+            )
+        )
+        print(f"📦 Archive {os.path.basename(path)}: {len(df)} hotspots")
+
+    return parts
+
+
+def build_stats_cube(csv_path, archive_dir=None):
+    """
+    Cube tiền tổng hợp: source × province × year × month × daynight × is_fire → count
+
+    Dựng 1 lần khi load dữ liệu; mọi truy vấn thống kê chỉ đọc cube.
+    """
+    parts = []
+    if csv_path and os.path.exists(csv_path):
+        parts.append(_load_dataset_rows(csv_path))
+    if archive_dir and os.path.isdir(archive_dir):
+        parts.extend(_load_archive_rows(archive_dir))
+
+    if not parts:
+        return pd.DataFrame(columns=CUBE_DIMENSIONS + ["count", "period"])
+
+    cube = pd.concat(parts).groupby(level=CUBE_DIMENSIONS).sum().reset_index()
+    cube["year"] = cube["year"].astype("int64")
+    cube["month"] = cube["month"].astype("int64")
+    # Khóa tháng liên tục để lọc theo khoảng thời gian
+    cube["period"] = cube["year"] * 12 + cube["month"] - 1
+
+    print(f"📊 Stats cube: {len(cube)} cells, {int(cube['count'].sum())} rows")
+    return cube
+
+
+def _parse_period(value):
+    """'YYYY-MM' → khóa tháng (cube chỉ có độ phân giải tháng, không nhận ngày)"""
+    match = PERIOD_PATTERN.fullmatch(str(value).strip())
+    if match is None or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"Invalid period {value!r}: expected YYYY-MM (month bounds)")
+    return int(match.group(1)) * 12 + int(match.group(2)) - 1
+
+
+def query_stats_cube(
+    cube,
+    start=None,
+    end=None,
+    provinces=None,
+    group_by=None,
+    is_fire=None,
+    daynight=None,
+    sources=None,
+):
+    """
+    Truy vấn cube (độ phân giải theo tháng)
+
+    - start / end: tháng đầu / tháng cuối dạng YYYY-MM (bao gồm 2 đầu)
+    - provinces, sources: danh sách giá trị cần giữ
+    - group_by: các chiều trong CUBE_DIMENSIONS, rỗng → chỉ trả tổng
+    """
+    group_by = list(group_by or [])
+    invalid = [d for d in group_by if d not in CUBE_DIMENSIONS]
+    if invalid:
+        raise ValueError(f"Invalid group_by: {invalid}. Allowed: {CUBE_DIMENSIONS}")
+
+    mask = np.ones(len(cube), dtype=bool)
+    if start is not None:
+        mask &= cube["period"].to_numpy() >= _parse_period(start)
+    if end is not None:
+        mask &= cube["period"].to_numpy() <= _parse_period(end)
+    if provinces:
+        mask &= cube["province"].isin(provinces).to_numpy()
+    if sources:
+        mask &= cube["source"].isin(sources).to_numpy()
+    if is_fire is not None:
+        mask &= cube["is_fire"].to_numpy() == int(is_fire)
+    if daynight is not None:
+        mask &= cube["daynight"].to_numpy() == daynight
+
+    selected = cube.loc[mask]
+    total = int(selected["count"].sum())
+
+    if not group_by:
+        return {"groups": [], "total": total}
+
+    grouped = (
+        selected.groupby(group_by)["count"].sum().reset_index().sort_values(group_by)
+    )
+    grouped["count"] = grouped["count"].astype("int64")
+
+    keys = group_by + ["count"]
+    columns = [grouped[k].tolist() for k in keys]
+    return {
+        "groups": [dict(zip(keys, values)) for values in zip(*columns)],
+        "total": total,
+    }
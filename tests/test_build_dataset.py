@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+import time
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+from shapely.geometry import box
+
+import build_dataset
+import utils
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+WEATHER_CACHE = os.path.join(FIXTURES, "weather_cache")
+
+# Cột dataset mà build_model dùng làm feature (trực tiếp hoặc qua feature_engineering)
+MODEL_FEATURES = [
+    "Tmax_C",
+    "RHmax_pct",
+    "Precip_sum_mm",
+    "Wind_max_kmh",
+    "Solar_rad_J_m2",
+    "Precip_sum_7d",
+    "Precip_sum_30d",
+    "bright_ti5",
+    "frp",
+    "scan",
+    "track",
+    "daynight",
+]
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    """2 tỉnh giả (hình chữ nhật) + điểm thời tiết từ fixtures/points.csv"""
+    vn_map = gpd.GeoDataFrame(
+        {"NAME_1": ["Ha Noi", "Hai Phong"]},
+        geometry=[box(105.0, 20.0, 106.0, 21.0), box(106.0, 20.0, 107.0, 21.0)],
+        crs="EPSG:4326",
+    )
+    monkeypatch.setattr(utils, "vn_map", vn_map)
+    monkeypatch.setattr(build_dataset, "DATA_CSV", os.path.join(FIXTURES, "points.csv"))
+
+    firms_dir = tmp_path / "firms"
+    firms_dir.mkdir()
+    return firms_dir, tmp_path / "dataset"
+
+
+def _add_firms(firms_dir, name):
+    shutil.copy(os.path.join(FIXTURES, "firms", name), firms_dir)
+
+
+def _build(firms_dir, out_dir, **kwargs):
+    return build_dataset.build_dataset(
+        firms_dir=str(firms_dir),
+        out_dir=str(out_dir),
+        cache_dir=WEATHER_CACHE,
+        workers=2,
+        offline=True,
+        **kwargs,
+    )
+
+
+def _row(df, province, day):
+    rows = df[(df["province"] == province) & (df["date"] == pd.Timestamp(day))]
+    assert len(rows) >= 1
+    return rows.iloc[0]
+
+
+def test_incremental_rebuild_and_rolling_precip_across_year(dirs):
+    firms_dir, out_dir = dirs
+
+    _add_firms(firms_dir, "firms_2023-12.csv")
+    first = pd.read_parquet(_build(firms_dir, out_dir))
+
+    # Điểm ngoài 2 tỉnh bị bỏ; mọi điểm nóng là mẫu dương (kể cả tin cậy thấp)
+    assert len(first) == 4
+    assert (first["is_fire"] == 1).all()
+    assert first["date"].max() == pd.Timestamp("2023-12-31")
+    assert _row(first, "Ha Noi", "2023-12-28")["Precip_sum_30d"] == pytest.approx(30)
+
+    # Lần chạy sau chỉ xử lý ngày mới hơn 2023-12-31 (bỏ dòng 2023-12-29 lặp lại)
+    _add_firms(firms_dir, "firms_2024-01.csv")
+    second_path = _build(firms_dir, out_dir)
+    second = pd.read_parquet(second_path)
+
+    assert len(second) == 3
+    assert second["date"].min() == pd.Timestamp("2024-01-02")
+    assert (second["is_fire"] == 1).all()
+    assert len(pd.read_parquet(str(out_dir))) == 7
+
+    # Tổng mưa trượt lấy cả ngày cuối năm trước
+    # Ha Noi: 1 mm/ngày → 7d = 7, 30d = 30
+    ha_noi = _row(second, "Ha Noi", "2024-01-02")
+    assert ha_noi["Precip_sum_7d"] == pytest.approx(7)
+    assert ha_noi["Precip_sum_30d"] == pytest.approx(30)
+    # Hai Phong: 2 mm/ngày tháng 12, khô tháng 1 → 28-31/12 và 5-31/12
+    hai_phong = _row(second, "Hai Phong", "2024-01-03")
+    assert hai_phong["Precip_sum_7d"] == pytest.approx(8)
+    assert hai_phong["Precip_sum_30d"] == pytest.approx(54)
+
+    # Không có gì mới → không ghi part nào
+    assert _build(firms_dir, out_dir) is None
+    assert len(os.listdir(out_dir)) == 2
+
+
+def test_negatives_are_days_without_detections(dirs):
+    firms_dir, out_dir = dirs
+    _add_firms(firms_dir, "firms_2023-12.csv")
+
+    df = pd.read_parquet(_build(firms_dir, out_dir, negatives=1.0))
+
+    fires = df[df["is_fire"] == 1]
+    negatives = df[df["is_fire"] == 0]
+    assert len(fires) == 4
+    # 2 tỉnh × 4 ngày, trừ 4 tỉnh-ngày có điểm nóng
+    assert len(negatives) == 4
+
+    fire_days = set(zip(fires["province"], fires["date"]))
+    assert not fire_days & set(zip(negatives["province"], negatives["date"]))
+
+    # Cột feature của build_model không trống / toàn 0 (fillna(0) sẽ lộ nhãn)
+    for col in MODEL_FEATURES:
+        assert negatives[col].notna().all(), col
+        assert not (negatives[col] == 0).all(), col
+
+    # Thuộc tính điểm nóng mượn từ điểm nóng thật cùng tỉnh
+    detections = set(zip(fires["province"], fires["frp"], fires["bright_ti5"]))
+    borrowed = zip(negatives["province"], negatives["frp"], negatives["bright_ti5"])
+    assert set(borrowed) <= detections
+
+
+class _ArchiveResponse:
+    def __init__(self, daily):
+        self.daily = daily
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"daily": self.daily}
+
+
+def test_weather_cache_written_mid_year_is_refetched(tmp_path, monkeypatch):
+    lat, lon = 20.5, 105.5
+    with open(build_dataset._weather_cache_path(WEATHER_CACHE, lat, lon, 2023)) as f:
+        full = json.load(f)
+    calls = []
+
+    def fake_get(url, params, timeout):
+        calls.append(params)
+        return _ArchiveResponse(full)
+
+    monkeypatch.setattr(build_dataset.requests, "get", fake_get)
+    path = build_dataset._weather_cache_path(str(tmp_path), lat, lon, 2023)
+    week_ago = time.time() - 7 * 86400
+
+    # Cache đủ tới 31/12 → dùng lại, không gọi API
+    with open(path, "w") as f:
+        json.dump(full, f)
+    os.utime(path, (week_ago, week_ago))
+    assert build_dataset.fetch_weather_year(lat, lon, 2023, str(tmp_path)) == full
+    assert calls == []
+
+    # Cache ghi lúc năm 2023 chưa hết (dừng ở 15/12) → tải lại và ghi đè
+    cut = full["time"].index("2023-12-15") + 1
+    with open(path, "w") as f:
+        json.dump({k: v[:cut] for k, v in full.items()}, f)
+    os.utime(path, (week_ago, week_ago))
+
+    daily = build_dataset.fetch_weather_year(lat, lon, 2023, str(tmp_path))
+
+    assert daily["time"][-1] == "2023-12-31"
+    assert [c["end_date"] for c in calls] == ["2023-12-31"]
+    with open(path) as f:
+        assert json.load(f)["time"][-1] == "2023-12-31"
@@ -0,0 +1,86 @@
+import pandas as pd
+
+import utils
+
+# ~375 m theo kinh độ ở vĩ độ 10° (khoảng cách pixel VIIRS)
+VIIRS_PIXEL_DEG = 0.0034
+
+
+def _hotspots(rows):
+    """rows: (source, lon, acq_date, acq_time, frp); cùng vĩ độ 10°"""
+    return pd.DataFrame(
+        rows, columns=["source", "longitude", "acq_date", "acq_time", "frp"]
+    ).assign(latitude=10.0)
+
+
+def test_cross_source_merge_keeps_max_frp():
+    df = _hotspots(
+        [
+            ("VIIRS_SNPP_NRT", 106.0, "2024-03-01", 1300, 10.0),
+            ("MODIS_NRT", 106.002, "2024-03-01", 1310, 20.0),
+        ]
+    )
+
+    result = utils.dedup_hotspots(df)
+
+    assert len(result) == 1
+    assert result.loc[0, "frp"] == 20.0
+    assert result.loc[0, "sources"] == ["MODIS_NRT", "VIIRS_SNPP_NRT"]
+    assert result.loc[0, "n_detections"] == 2
+
+
+def test_adjacent_same_source_pixels_not_merged():
+    df = _hotspots(
+        [
+            ("VIIRS_SNPP_NRT", 106.0 + k * VIIRS_PIXEL_DEG, "2024-03-01", 1300, 5.0)
+            for k in range(3)
+        ]
+    )
+
+    result = utils.dedup_hotspots(df)
+
+    assert len(result) == 3
+    assert (result["n_detections"] == 1).all()
+
+
+def test_at_most_one_detection_per_source_per_cluster():
+    # 2 pixel SNPP liền kề đều nằm trong dung sai của điểm MODIS
+    df = _hotspots(
+        [
+            ("MODIS_NRT", 106.0, "2024-03-01", 1300, 50.0),
+            ("VIIRS_SNPP_NRT", 106.0, "2024-03-01", 1305, 8.0),
+            ("VIIRS_SNPP_NRT", 106.0 + VIIRS_PIXEL_DEG, "2024-03-01", 1305, 9.0),
+        ]
+    )
+
+    result = utils.dedup_hotspots(df).sort_values("frp", ignore_index=True)
+
+    assert len(result) == 2
+    assert result["n_detections"].tolist() == [1, 2]
+    for sources, n in zip(result["sources"], result["n_detections"]):
+        assert len(set(sources)) == len(sources) == n
+    # Neo MODIS nhận pixel SNPP gần nhất, pixel xa hơn đứng riêng
+    assert result.loc[0, "longitude"] == 106.0 + VIIRS_PIXEL_DEG
+
+
+def test_merge_across_midnight():
+    df = _hotspots(
+        [
+            ("VIIRS_SNPP_NRT", 106.0, "2024-03-01", 2355, 7.0),
+            ("VIIRS_NOAA20_NRT", 106.0, "2024-03-02", 15, 6.0),
+            ("MODIS_NRT", 106.0, "2024-03-02", 300, 9.0),
+        ]
+    )
+
+    result = utils.dedup_hotspots(df).sort_values("frp", ignore_index=True)
+
+    # 2 lần quét qua nửa đêm gộp lại; MODIS cách 3 giờ → ngoài khung thời gian
+    assert result["n_detections"].tolist() == [2, 1]
+    assert result.loc[0, "acq_date"] == "2024-03-01"
+
+
+def test_empty_frame():
+    result = utils.dedup_hotspots(utils._empty_firms_frame())
+
+    assert result.empty
+    assert {"sources", "n_detections"} <= set(result.columns)
@@ -0,0 +1,41 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostClassifier, Pool
+
+import utils
+
+CACHE_MAX = 4
+
+
+@pytest.fixture
+def model_and_rows(monkeypatch):
+    """CatBoost nhỏ + cache SHAP rỗng, giới hạn CACHE_MAX dòng"""
+    monkeypatch.setattr(utils, "SHAP_CACHE_MAX", CACHE_MAX)
+    monkeypatch.setattr(utils, "shap_cache", OrderedDict())
+
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(200, 3)), columns=["frp", "Tmax_C", "RHmax_pct"])
+    y = (X["frp"] + 0.5 * X["Tmax_C"] > 0).astype(int)
+    model = CatBoostClassifier(
+        iterations=20, depth=3, verbose=False, allow_writing_files=False
+    ).fit(X, y)
+    return model, X.iloc[:10]
+
+
+def test_batch_larger_than_cache(model_and_rows):
+    model, X = model_and_rows
+    expected = model.get_feature_importance(data=Pool(X), type="ShapValues")
+
+    contributions, base = utils.explain_batch(model, X, "v1")
+
+    np.testing.assert_allclose(contributions.to_numpy(), expected[:, :-1])
+    np.testing.assert_allclose(base, expected[:, -1])
+    assert list(contributions.index) == list(X.index)
+    assert len(utils.shap_cache) == CACHE_MAX
+
+    # Lần 2: phần còn trong cache + phần tính lại vẫn ghép đúng thứ tự
+    again, _ = utils.explain_batch(model, X, "v1")
+    np.testing.assert_allclose(again.to_numpy(), expected[:, :-1])
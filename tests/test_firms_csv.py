@@ -0,0 +1,19 @@
+import utils
+
+HEADER = (
+    "latitude,longitude,bright_ti4,scan,track,acq_date,acq_time,satellite,"
+    "instrument,confidence,version,bright_ti5,frp,daynight\n"
+)
+
+
+def test_blank_acq_time_gets_default(monkeypatch):
+    monkeypatch.setattr(utils, "vn_map", None)
+    csv = (
+        HEADER
+        + "21.0,105.8,330,0.4,0.4,2024-03-01,,N,VIIRS,n,2,300,10,D\n"
+        + "21.1,105.9,330,0.4,0.4,2024-03-01,0630,N,VIIRS,n,2,300,10,D\n"
+    ).encode()
+
+    df = utils._process_firms_data(utils._read_firms_csv(csv))
+
+    assert df["acq_time"].tolist() == [utils.FIRMS_DEFAULTS["acq_time"], 630]
@@ -0,0 +1,19 @@
+from fastapi.testclient import TestClient
+
+import main
+
+POINT = {"lat": 21.0, "lon": 105.8}
+
+
+def test_null_k_without_radius_is_rejected():
+    client = TestClient(main.app)
+
+    resp = client.post("/api/realtime/nearby", json={"points": [POINT], "k": None})
+
+    assert resp.status_code == 422
+
+
+def test_null_k_with_radius_is_allowed():
+    query = main.NearbyQuery(points=[POINT], k=None, radius_km=5)
+
+    assert query.k is None
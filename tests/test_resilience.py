@@ -0,0 +1,111 @@
+import time
+
+import pandas as pd
+import pytest
+
+import utils
+from utils import CircuitBreaker, StaleWhileRevalidateCache, UpstreamUnavailable
+
+RESET_TIMEOUT_S = 0.05
+
+FIRMS_ROWS = pd.DataFrame(
+    {
+        "latitude": [21.0],
+        "longitude": [105.8],
+        "bright_ti4": [330.0],
+        "bright_ti5": [300.0],
+        "frp": [12.5],
+        "scan": [0.4],
+        "track": [0.4],
+        "acq_date": [time.strftime("%Y-%m-%d")],
+        "acq_time": [630],
+        "confidence": ["n"],
+        "daynight": ["D"],
+    }
+)
+
+
+@pytest.fixture
+def firms(monkeypatch):
+    """FIRMS giả: breaker / cache mới; state["up"] bật tắt, state["down"] = nguồn lỗi"""
+    breaker = CircuitBreaker("FIRMS-test", reset_timeout=RESET_TIMEOUT_S)
+    cache = StaleWhileRevalidateCache("FIRMS-test", 600, breaker)
+    state = {"up": False, "down": set(), "requests": 0}
+
+    def request(url):
+        state["requests"] += 1
+        if not state["up"] or any(f"/{source}/" in url for source in state["down"]):
+            raise ConnectionError("FIRMS down")
+        return FIRMS_ROWS.copy()
+
+    monkeypatch.setattr(utils, "firms_breaker", breaker)
+    monkeypatch.setattr(utils, "firms_cache", cache)
+    monkeypatch.setattr(utils, "_request_firms_csv", request)
+    monkeypatch.setattr(utils, "load_vn_map", lambda: None)
+    return breaker, state
+
+
+def test_firms_breaker_recovers_after_outage(firms):
+    breaker, state = firms
+
+    # Mỗi lần crawl lỗi (mọi nguồn) chỉ tính 1 lỗi cho breaker
+    for attempt in range(breaker.max_failures):
+        with pytest.raises(UpstreamUnavailable):
+            utils.get_firms_hotspots(1)
+        assert breaker.failures == attempt + 1
+    assert breaker.is_open()
+
+    # Đang ngắt mạch → từ chối ngay, không gọi upstream
+    requests_before = state["requests"]
+    with pytest.raises(UpstreamUnavailable):
+        utils.get_firms_hotspots(1)
+    assert state["requests"] == requests_before
+
+    # Hết reset_timeout + upstream hồi phục → lần thử half-open đóng mạch
+    state["up"] = True
+    time.sleep(RESET_TIMEOUT_S * 2)
+    df, meta = utils.get_firms_hotspots(1)
+
+    assert len(df) == 1
+    assert meta["stale"] is False
+    assert breaker.failures == 0
+    assert not breaker.is_open()
+
+
+def test_cold_miss_reports_stored_timestamp(firms):
+    _, state = firms
+    state["up"] = True
+
+    _, first = utils.get_firms_hotspots(1)
+    _, second = utils.get_firms_hotspots(1)
+
+    assert first["fetched_at"] == second["fetched_at"]
+
+
+def test_partial_crawl_does_not_replace_complete_snapshot(firms):
+    breaker, state = firms
+    state["up"] = True
+    complete, meta = utils.get_firms_hotspots(1)
+    assert meta["missing"] == []
+    assert complete.loc[0, "n_detections"] == len(utils.FIRMS_SOURCES_NRT)
+
+    # 1 nguồn lỗi khi làm mới → giữ snapshot đầy đủ, tính là 1 lỗi cho breaker
+    state["down"] = {"MODIS_NRT"}
+    utils.firms_cache._refresh(("realtime",), utils.crawl_firms_realtime)
+
+    df, meta = utils.get_firms_hotspots(1)
+    assert df is complete
+    assert meta["missing"] == []
+    assert breaker.failures == 1
+
+
+def test_partial_crawl_on_cold_miss_reports_missing_sources(firms):
+    _, state = firms
+    state["up"] = True
+    state["down"] = {"MODIS_NRT"}
+
+    df, meta = utils.get_firms_hotspots(1)
+
+    assert meta["missing"] == ["MODIS_NRT"]
+    assert "MODIS_NRT" not in df.loc[0, "sources"]
+    assert df.loc[0, "n_detections"] == len(utils.FIRMS_SOURCES_NRT) - 1
@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import utils
+
+START = date(2024, 3, 1)
+PAST_DAYS, FORECAST_DAYS = 30, 10
+
+
+def _daily():
+    """Chuỗi Open-Meteo giả: 30 ngày quá khứ mưa 1 mm + 10 ngày dự báo mưa 2 mm"""
+    days = [START + timedelta(days=i) for i in range(PAST_DAYS + FORECAST_DAYS)]
+    return {
+        "time": [d.isoformat() for d in days],
+        "temperature_2m_max": [31.0] * len(days),
+        "relative_humidity_2m_max": [85.0] * len(days),
+        "precipitation_sum": [1.0] * PAST_DAYS + [2.0] * FORECAST_DAYS,
+        "wind_speed_10m_max": [12.0] * len(days),
+        "shortwave_radiation_sum": [18.0] * len(days),
+    }
+
+
+def test_weather_features_rolling_sums_over_past_and_forecast():
+    first_forecast = START + timedelta(days=PAST_DAYS)
+    last = START + timedelta(days=PAST_DAYS + FORECAST_DAYS - 1)
+
+    features = utils.weather_features(_daily(), [first_forecast, last])
+
+    assert list(features.columns) == utils.WEATHER_FEATURES
+    # Ngày dự báo đầu: 6 ngày quá khứ + chính nó / 29 ngày quá khứ + chính nó
+    assert features.loc[pd.Timestamp(first_forecast), "Precip_sum_7d"] == 8.0
+    assert features.loc[pd.Timestamp(first_forecast), "Precip_sum_30d"] == 31.0
+    # Ngày cuối: 7 ngày dự báo / 20 ngày quá khứ + 10 ngày dự báo
+    assert features.loc[pd.Timestamp(last), "Precip_sum_7d"] == 14.0
+    assert features.loc[pd.Timestamp(last), "Precip_sum_30d"] == 40.0
+
+
+def test_weather_features_drops_dates_outside_series():
+    before = START - timedelta(days=1)
+    after = START + timedelta(days=PAST_DAYS + FORECAST_DAYS)
+
+    features = utils.weather_features(_daily(), [before, START, after])
+
+    assert list(features.index) == [pd.Timestamp(START)]
+
+
+def test_preprocess_default_day_is_vietnam_today(monkeypatch):
+    vn_today = date(2024, 7, 1)
+    monkeypatch.setattr(utils, "_local_today", lambda: vn_today)
+    df = pd.DataFrame({"frp": [5.0], "Precip_sum_7d": [1.0], "Precip_sum_30d": [4.0]})
+    preprocessors = {"expected_columns": ["day_sin", "day_cos"]}
+
+    default = utils.preprocess_batch(df, preprocessors)
+    explicit = utils.preprocess_batch(df, preprocessors, dates=[vn_today])
+
+    np.testing.assert_allclose(default.to_numpy(), explicit.to_numpy())
@@ -1,12 +1,17 @@
 import numpy as np
 import pandas as pd
 import requests
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
 import geopandas as gpd
-from shapely.geometry import Point
+from sklearn.neighbors import BallTree
+from catboost import Pool
+import hashlib
 import os
 import io
 import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # ========== CONFIG ==========
 FIRMS_KEY = os.getenv("FIRMS_API_KEY", "3462395fdce3c9da8d92cefcbade1e3c")
@@ -21,7 +26,299 @@ FIRMS_SOURCES_NRT = [
     "MODIS_NRT",
 ]
 
+# Schema cố định của CSV FIRMS (VIIRS + MODIS). Cột ngoài schema bị bỏ khi parse.
+FIRMS_DTYPES = {
+    "latitude": "float64",
+    "longitude": "float64",
+    "bright_ti4": "float64",
+    "bright_ti5": "float64",
+    "brightness": "float64",  # MODIS
+    "bright_t31": "float64",  # MODIS
+    "scan": "float64",
+    "track": "float64",
+    "acq_date": "string",
+    "acq_time": "Int32",  # nullable: ô trống → FIRMS_DEFAULTS
+    "satellite": "category",
+    "instrument": "category",
+    "confidence": "category",
+    "version": "category",
+    "frp": "float64",
+    "daynight": "category",
+    "type": "float64",
+}
+
+FIRMS_DEFAULTS = {
+    "frp": 5.0,
+    "bright_ti4": 300.0,
+    "bright_ti5": 310.0,
+    "scan": 0.5,
+    "track": 0.5,
+    "acq_time": 1200,
+}
+
+HOTSPOT_FIELDS = [
+    "latitude",
+    "longitude",
+    "bright_ti4",
+    "bright_ti5",
+    "frp",
+    "province",
+    "acq_date",
+    "acq_time",
+    "scan",
+    "track",
+]
+
+# Tên trường trả về cho client → cột trong DataFrame
+HOTSPOT_API_FIELDS = {
+    "lat": "latitude",
+    "lon": "longitude",
+    "bright": "bright_ti4",
+    "bright_ti5": "bright_ti5",
+    "frp": "frp",
+    "province": "province",
+    "acq_date": "acq_date",
+    "acq_time": "acq_time",
+    "scan": "scan",
+    "track": "track",
+}
+
+# Chỉ có sau khi khử trùng lặp (dedup_hotspots) / truy vấn lân cận
+HOTSPOT_API_OPTIONAL_FIELDS = {
+    "sources": "sources",
+    "n_detections": "n_detections",
+    "distance_km": "distance_km",
+}
+
+# Khử trùng lặp điểm nóng giữa các vệ tinh
+DEDUP_DISTANCE_M = 500.0
+DEDUP_TIME_WINDOW_MIN = 60
+EARTH_RADIUS_M = 6_371_000.0
+
+# Upstream: timeout (connect, read), thời gian còn "tươi" của cache, ngắt mạch
+FIRMS_TIMEOUT = (5, 30)
+FIRMS_FRESH_TTL_S = 600
+WEATHER_TIMEOUT = (3, 8)
+WEATHER_FRESH_TTL_S = 3600
+WEATHER_CACHE_MAX = 4096
+# Làm tròn tọa độ khi gọi Open-Meteo (~11 km, cỡ ô lưới mô hình) để tái dùng cache
+WEATHER_COORD_DECIMALS = 1
+BREAKER_MAX_FAILURES = 3
+BREAKER_RESET_TIMEOUT_S = 30
+
+# Open-Meteo daily → tên feature của model
+WEATHER_DAILY_VARIABLES = {
+    "temperature_2m_max": "Tmax_C",
+    "relative_humidity_2m_max": "RHmax_pct",
+    "precipitation_sum": "Precip_sum_mm",
+    "wind_speed_10m_max": "Wind_max_kmh",
+    "shortwave_radiation_sum": "Solar_rad_J_m2",
+}
+WEATHER_FEATURES = [
+    "Tmax_C",
+    "RHmax_pct",
+    "Precip_sum_mm",
+    "Precip_sum_7d",
+    "Precip_sum_30d",
+    "Wind_max_kmh",
+    "Solar_rad_J_m2",
+]
+# Số ngày dự báo tối đa (Open-Meteo cho tới 16); mọi horizon dùng chung 1 cache
+WEATHER_FORECAST_DAYS = 16
+VN_TZ = timezone(timedelta(hours=7))
+
+# Cache giải thích SHAP theo (phiên bản model, vector đầu vào)
+SHAP_CACHE_MAX = 50_000
+
 vn_map = None
+hotspot_index = None
+shap_cache = OrderedDict()
+shap_lock = threading.Lock()
+
+
+# ========== UPSTREAM RESILIENCE ==========
+class UpstreamUnavailable(Exception):
+    """Upstream lỗi / đang ngắt mạch và không có dữ liệu cũ để trả về"""
+
+
+class PartialUpstream(UpstreamUnavailable):
+    """Chỉ một phần upstream trả lời: value là kết quả thiếu, missing là phần lỗi"""
+
+    def __init__(self, message, value, missing):
+        super().__init__(message)
+        self.value = value
+        self.missing = list(missing)
+
+
+class CircuitBreaker:
+    """
+    Ngắt mạch cho 1 upstream
+
+    - closed: gọi bình thường
+    - open: sau max_failures lỗi liên tiếp → từ chối ngay trong reset_timeout giây
+    - half-open: hết reset_timeout → cho 1 lần thử, thành công thì đóng lại
+    """
+
+    def __init__(
+        self,
+        name,
+        max_failures=BREAKER_MAX_FAILURES,
+        reset_timeout=BREAKER_RESET_TIMEOUT_S,
+    ):
+        self.name = name
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        """Đang ngắt mạch (chưa hết reset_timeout) — không thay đổi trạng thái"""
+        with self._lock:
+            return (
+                self.opened_at is not None
+                and time.time() - self.opened_at < self.reset_timeout
+            )
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_running:
+                return False
+            if time.time() - self.opened_at >= self.reset_timeout:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.max_failures:
+                if self.opened_at is None:
+                    print(f"🔌 Circuit open: {self.name}")
+                self.opened_at = time.time()
+
+    def call(self, fn, *args, **kwargs):
+        if not self.allow():
+            raise UpstreamUnavailable(f"{self.name} circuit open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+class StaleWhileRevalidateCache:
+    """
+    Cache stale-while-revalidate
+
+    - Còn tươi (< fresh_ttl): trả ngay
+    - Đã cũ: trả ngay giá trị cũ (stale=True, kèm tuổi) và làm mới ở nền
+    - Chưa có: gọi đồng bộ; lỗi → UpstreamUnavailable
+    """
+
+    def __init__(self, name, fresh_ttl, breaker, max_entries=None):
+        self.name = name
+        self.fresh_ttl = fresh_ttl
+        self.breaker = breaker
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _store(self, key, value, missing=()):
+        """Lưu giá trị (missing: phần upstream thiếu), trả thời điểm lưu (fetched_at)"""
+        fetched_at = time.time()
+        with self._lock:
+            self._entries[key] = (value, fetched_at, list(missing))
+            self._entries.move_to_end(key)
+            if self.max_entries and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fetched_at
+
+    def _refresh(self, key, fetch):
+        try:
+            self._store(key, self.breaker.call(fetch))
+        except PartialUpstream as e:
+            # Kết quả thiếu không thay snapshot đầy đủ (chỉ thay snapshot cũng thiếu)
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and entry[2]:
+                self._store(key, e.value, e.missing)
+            print(f"⚠️ {self.name} partial refresh: missing {e.missing}")
+        except Exception as e:
+            print(f"⚠️ {self.name} refresh failed: {str(e)[:80]}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key, fetch):
+        """
+        Trả (value, meta) với meta = {stale, age_s, fetched_at, missing}
+
+        Chưa có gì mà upstream chỉ trả 1 phần → dùng tạm kết quả thiếu
+        (missing khác rỗng) và làm mới lại ở lần gọi sau.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None:
+            missing = []
+            try:
+                value = self.breaker.call(fetch)
+            except PartialUpstream as e:
+                value, missing = e.value, e.missing
+            except UpstreamUnavailable:
+                raise
+            except Exception as e:
+                raise UpstreamUnavailable(f"{self.name}: {str(e)[:80]}") from e
+            fetched_at = self._store(key, value, missing)
+            return value, {
+                "stale": False,
+                "age_s": 0.0,
+                "fetched_at": fetched_at,
+                "missing": missing,
+            }
+
+        value, fetched_at, missing = entry
+        age = time.time() - fetched_at
+        stale = age >= self.fresh_ttl
+
+        if stale or missing:
+            with self._lock:
+                start = key not in self._refreshing and not self.breaker.is_open()
+                if start:
+                    self._refreshing.add(key)
+            if start:
+                threading.Thread(
+                    target=self._refresh, args=(key, fetch), daemon=True
+                ).start()
+
+        return value, {
+            "stale": stale,
+            "age_s": round(age, 1),
+            "fetched_at": fetched_at,
+            "missing": missing,
+        }
+
+
+firms_breaker = CircuitBreaker("FIRMS")
+weather_breaker = CircuitBreaker("Open-Meteo")
+firms_cache = StaleWhileRevalidateCache("FIRMS", FIRMS_FRESH_TTL_S, firms_breaker)
+weather_cache = StaleWhileRevalidateCache(
+    "Open-Meteo", WEATHER_FRESH_TTL_S, weather_breaker, max_entries=WEATHER_CACHE_MAX
+)
 
 
 def load_vn_map():
@@ -37,55 +334,150 @@ def load_vn_map():
             print(f"❌ Map load error: {e}")
 
 
-def get_province_from_latlon(lat, lon):
-    """Xác định tỉnh từ tọa độ"""
+def assign_provinces(lat, lon):
+    """Xác định tỉnh cho mảng tọa độ (vector hóa, dùng spatial index)"""
+    lat = np.asarray(lat, dtype="float64")
+    lon = np.asarray(lon, dtype="float64")
+    provinces = np.full(len(lat), None, dtype=object)
+
     load_vn_map()
-    if vn_map is None:
-        return "Unknown"
+    if vn_map is None or len(lat) == 0:
+        return provinces
+
+    points = gpd.points_from_xy(lon, lat)
+    point_idx, poly_idx = vn_map.sindex.query(points, predicate="within")
+
+    # Điểm nằm trên ranh giới 2 tỉnh: giữ tỉnh đầu tiên như sjoin().iloc[0]
+    point_idx, first = np.unique(point_idx, return_index=True)
+    provinces[point_idx] = vn_map["NAME_1"].to_numpy()[poly_idx[first]]
+    return provinces
 
-    try:
-        point = Point(lon, lat)
-        point_gdf = gpd.GeoDataFrame(geometry=[point], crs="EPSG:4326")
-        joined = gpd.sjoin(point_gdf, vn_map, how="inner", predicate="within")
 
-        if not joined.empty:
-            return joined.iloc[0]["NAME_1"]
+def get_province_from_latlon(lat, lon):
+    """Xác định tỉnh từ tọa độ"""
+    try:
+        province = assign_provinces([lat], [lon])[0]
+        if province is not None:
+            return province
     except:
         pass
 
     return "Unknown"
 
 
-def crawl_firms_realtime():
-    """Crawl hôm nay"""
+def load_province_points(csv_path="data.csv"):
+    """
+    Tọa độ lấy thời tiết cho mỗi tỉnh
+
+    Ưu tiên điểm đã dùng trong data.csv (latitude_x / longitude_x),
+    tỉnh còn thiếu lấy representative_point() từ bản đồ GADM.
+    """
+    points = {}
     load_vn_map()
-    today = date.today().strftime("%Y-%m-%d")
+    if vn_map is not None:
+        reps = vn_map.geometry.representative_point()
+        for name, pt in zip(vn_map["NAME_1"], reps):
+            points[name] = (round(pt.y, 4), round(pt.x, 4))
 
-    for source in FIRMS_SOURCES_NRT:
-        url = f"https://firms.modaps.eosdis.nasa.gov/api/area/csv/{FIRMS_KEY}/{source}/{FIRMS_AREA}/1/{today}"
+    if csv_path and os.path.exists(csv_path):
+        df = pd.read_csv(csv_path, usecols=["province", "latitude_x", "longitude_x"])
+        first = df.drop_duplicates("province")
+        for name, lat, lon in first.itertuples(index=False):
+            points[name] = (lat, lon)
 
-        try:
-            print(f"📡 {source} (today)...")
-            resp = requests.get(url, timeout=30)
+    return points
 
-            if resp.status_code == 429:
-                print(f"⚠️ Rate limit, wait 60s...")
-                time.sleep(60)
-                continue
 
-            resp.raise_for_status()
-            df = pd.read_csv(io.StringIO(resp.text))
+def _read_firms_csv(source):
+    """Đọc CSV FIRMS theo schema cố định (bytes/stream → cột có kiểu)"""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
 
-            if not df.empty:
-                print(f"✅ {len(df)} hotspots from {source}")
-                return _process_firms_data(df)
+    return pd.read_csv(
+        source,
+        usecols=lambda c: c in FIRMS_DTYPES,
+        dtype=FIRMS_DTYPES,
+    )
 
-        except Exception as e:
-            print(f"⚠️ {source}: {str(e)[:80]}")
-            continue
 
-    print("ℹ️ No hotspots today")
-    return []
+def _request_firms_csv(url):
+    """Gọi FIRMS và parse trực tiếp từ stream response"""
+    with requests.get(url, timeout=FIRMS_TIMEOUT, stream=True) as resp:
+        # 429 được tính là lỗi → circuit breaker quyết định khi nào thử lại
+        resp.raise_for_status()
+        resp.raw.decode_content = True
+        return _read_firms_csv(resp.raw)
+
+
+def _fetch_firms_source(source, days, end_date):
+    """
+    1 nguồn FIRMS; lỗi → None
+
+    Không qua firms_breaker: breaker chỉ đặt ở tầng cache (firms_cache),
+    mỗi lần crawl tính đúng 1 lần thành công / thất bại.
+    """
+    url = f"https://firms.modaps.eosdis.nasa.gov/api/area/csv/{FIRMS_KEY}/{source}/{FIRMS_AREA}/{days}/{end_date.strftime('%Y-%m-%d')}"
+
+    try:
+        print(f"📡 {source} ({days} days)...")
+        df = _request_firms_csv(url)
+    except Exception as e:
+        print(f"⚠️ {source}: {str(e)[:80]}")
+        return None
+
+    if df.empty:
+        print(f"ℹ️ No data from {source}")
+    else:
+        print(f"✅ {len(df)} hotspots from {source}")
+        df["source"] = source
+    return df
+
+
+def _crawl_firms_sources(days, end_date):
+    """
+    Crawl song song tất cả nguồn FIRMS, gắn tên nguồn và gộp lại
+
+    Trả (DataFrame, danh sách nguồn lỗi). Raise UpstreamUnavailable nếu không
+    nguồn nào trả lời được (để cache giữ lại dữ liệu cũ thay vì lưu kết quả rỗng).
+    """
+    with ThreadPoolExecutor(max_workers=len(FIRMS_SOURCES_NRT)) as pool:
+        results = list(
+            pool.map(
+                lambda source: _fetch_firms_source(source, days, end_date),
+                FIRMS_SOURCES_NRT,
+            )
+        )
+
+    if all(df is None for df in results):
+        raise UpstreamUnavailable("FIRMS: all sources failed")
+
+    missing = [s for s, df in zip(FIRMS_SOURCES_NRT, results) if df is None]
+    frames = [df for df in results if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame(), missing
+
+    # MODIS & VIIRS có cột khác nhau → concat sẽ để NaN, _process_firms_data điền mặc định
+    return pd.concat(frames, ignore_index=True), missing
+
+
+def _crawl_result(df, missing):
+    """Kết quả crawl; thiếu nguồn → PartialUpstream (cache không coi là snapshot tốt)"""
+    if missing:
+        raise PartialUpstream(f"FIRMS: missing {missing}", df, missing)
+    return df
+
+
+def crawl_firms_realtime():
+    """Crawl hôm nay (gộp mọi vệ tinh + khử trùng lặp)"""
+    load_vn_map()
+    today = date.today()
+
+    df, missing = _crawl_firms_sources(1, today)
+    if df.empty:
+        print("ℹ️ No hotspots today")
+        return _crawl_result(_empty_firms_frame(), missing)
+
+    return _crawl_result(dedup_hotspots(_process_firms_data(df)), missing)
 
 
 def crawl_firms_historical(days=7):
@@ -93,11 +485,12 @@ def crawl_firms_historical(days=7):
     Crawl lịch sử - LOGIC MỚI
 
     Strategy mới:
-    1. Nếu days <= 10: Single request
+    1. Nếu days <= 10: Single request mỗi nguồn
     2. Nếu days > 10: Single request với min(days, 10) ngày gần nhất
        → Vì NRT data chỉ có ~10 ngày
 
     KHÔNG chia batch nữa vì sẽ bị overlap!
+    Các nguồn được gộp rồi khử trùng lặp bằng dedup_hotspots().
     """
     load_vn_map()
     today = date.today()
@@ -119,50 +512,51 @@ def crawl_firms_historical(days=7):
         f"📅 Date range: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
     )
 
-    # Try sources
-    for source in FIRMS_SOURCES_NRT:
-        # Use end_date as reference point
-        url = f"https://firms.modaps.eosdis.nasa.gov/api/area/csv/{FIRMS_KEY}/{source}/{FIRMS_AREA}/{actual_days}/{end_date.strftime('%Y-%m-%d')}"
+    df, missing = _crawl_firms_sources(actual_days, end_date)
+    if df.empty:
+        print(f"ℹ️ No hotspots in last {actual_days} days")
+        return _crawl_result(_empty_firms_frame(), missing)
 
-        try:
-            print(f"📡 {source} ({actual_days} days)...")
-            resp = requests.get(url, timeout=30)
-
-            if resp.status_code == 429:
-                print(f"⚠️ Rate limit, wait 60s...")
-                time.sleep(60)
-                resp = requests.get(url, timeout=30)
-
-            resp.raise_for_status()
-            df = pd.read_csv(io.StringIO(resp.text))
-
-            if not df.empty:
-                # Filter by date range to be extra safe
-                if "acq_date" in df.columns:
-                    df["acq_date_parsed"] = pd.to_datetime(df["acq_date"])
-                    df = df[
-                        (df["acq_date_parsed"].dt.date >= start_date)
-                        & (df["acq_date_parsed"].dt.date <= end_date)
-                    ]
-                    df = df.drop(columns=["acq_date_parsed"])
-
-                print(f"✅ {len(df)} hotspots from {source}")
-                return _process_firms_data(df)
-            else:
-                print(f"ℹ️ No data from {source}")
+    # Filter by date range to be extra safe
+    # (acq_date là chuỗi ISO YYYY-MM-DD → so sánh chuỗi là đủ)
+    if "acq_date" in df.columns:
+        acq_date = df["acq_date"]
+        df = df[
+            (acq_date >= start_date.strftime("%Y-%m-%d"))
+            & (acq_date <= end_date.strftime("%Y-%m-%d"))
+        ]
 
-        except Exception as e:
-            print(f"⚠️ {source}: {str(e)[:80]}")
-            continue
+    return _crawl_result(dedup_hotspots(_process_firms_data(df)), missing)
 
-    print(f"ℹ️ No hotspots in last {actual_days} days")
-    return []
+
+def get_firms_hotspots(days=1):
+    """
+    Điểm nóng qua cache stale-while-revalidate
+
+    Trả (DataFrame, meta); meta cho biết dữ liệu có cũ không và bao nhiêu giây,
+    meta["missing"] liệt kê nguồn FIRMS còn thiếu (chưa có snapshot đầy đủ nào).
+    """
+    actual_days = min(days, 10)
+    if actual_days == 1:
+        return firms_cache.get(("realtime",), crawl_firms_realtime)
+
+    return firms_cache.get(
+        ("historical", actual_days),
+        lambda: crawl_firms_historical(actual_days),
+    )
+
+
+def _empty_firms_frame():
+    """DataFrame rỗng với đủ cột đầu ra"""
+    return pd.DataFrame(
+        {c: pd.Series(dtype=FIRMS_DTYPES.get(c, "object")) for c in HOTSPOT_FIELDS}
+    )
 
 
 def _process_firms_data(df):
-    """Process FIRMS data"""
+    """Process FIRMS data (giữ dạng cột, không chuyển sang dict)"""
     if df.empty:
-        return []
+        return _empty_firms_frame()
 
     # Validate
     required = ["latitude", "longitude", "acq_date"]
@@ -170,96 +564,355 @@ def _process_firms_data(df):
 
     if missing:
         print(f"⚠️ Missing: {missing}")
-        return []
+        return _empty_firms_frame()
 
-    # Default values
-    if "frp" not in df.columns:
-        df["frp"] = 5.0
+    df = df.reset_index(drop=True)
 
-    if "bright_ti5" not in df.columns:
-        if "bright_t31" in df.columns:
-            df["bright_ti5"] = df["bright_t31"]  # MODIS
-        else:
-            df["bright_ti5"] = 310.0
+    # Default values (MODIS dùng brightness / bright_t31 thay cho kênh I4 / I5)
+    for col, modis_col in (("bright_ti4", "brightness"), ("bright_ti5", "bright_t31")):
+        if modis_col in df.columns:
+            df[col] = (
+                df[col].fillna(df[modis_col]) if col in df.columns else df[modis_col]
+            )
 
-    if "scan" not in df.columns:
-        df["scan"] = 0.5
-    if "track" not in df.columns:
-        df["track"] = 0.5
-    if "acq_time" not in df.columns:
-        df["acq_time"] = 1200
+    for col, default in FIRMS_DEFAULTS.items():
+        if col not in df.columns:
+            df[col] = default
+        else:
+            df[col] = df[col].fillna(default)
 
     # Spatial filter
     if vn_map is None:
         df["province"] = "Unknown"
-        return df.to_dict(orient="records")
+        return df
 
     try:
-        gdf = gpd.GeoDataFrame(
-            df, geometry=gpd.points_from_xy(df.longitude, df.latitude), crs="EPSG:4326"
+        provinces = assign_provinces(df["latitude"], df["longitude"])
+    except Exception as e:
+        print(f"⚠️ Filter error: {e}")
+        df["province"] = "Unknown"
+        return df
+
+    in_vn = pd.notna(provinces)
+    print(f"🇻🇳 {len(df)} → {int(in_vn.sum())} hotspots in VN")
+
+    df = df.loc[in_vn].reset_index(drop=True)
+    df["province"] = provinces[in_vn]
+    return df
+
+
+def _haversine_m(lat1, lon1, lat2, lon2):
+    """Khoảng cách haversine (mét) giữa các mảng tọa độ"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _acq_minutes(df):
+    """Thời điểm quan sát (phút kể từ epoch) từ acq_date + acq_time (HHMM)"""
+    days = (
+        pd.to_datetime(df["acq_date"], format="%Y-%m-%d")
+        .to_numpy()
+        .astype("datetime64[D]")
+        .astype("int64")
+    )
+    hhmm = df["acq_time"].to_numpy().astype("int64")
+    return days * 1440 + (hhmm // 100) * 60 + hhmm % 100
+
+
+def dedup_hotspots(
+    df, distance_m=DEDUP_DISTANCE_M, time_window_min=DEDUP_TIME_WINDOW_MIN
+):
+    """
+    Khử trùng lặp điểm nóng giữa các vệ tinh
+
+    - Chia điểm vào lưới (ô lat/lon cỡ distance_m × khung thời gian time_window_min)
+    - Chỉ so sánh các ô láng giềng → gần tuyến tính theo số điểm
+    - Chỉ gộp điểm của các nguồn khác nhau, cách nhau <= distance_m và <= time_window_min
+      (các pixel liền kề của cùng 1 vệ tinh là 1 đám cháy kéo dài, không phải trùng lặp)
+    - Mỗi cụm neo quanh bản ghi FRP cao nhất, tối đa 1 bản ghi mỗi nguồn (không nối bắc cầu)
+    - Cột `sources` liệt kê các nguồn đóng góp
+    """
+    if df.empty:
+        df = df.copy()
+        df["sources"] = pd.Series(dtype=object)
+        df["n_detections"] = pd.Series(dtype="int64")
+        return df
+
+    df = df.reset_index(drop=True)
+    n = len(df)
+
+    lat = df["latitude"].to_numpy(dtype="float64")
+    lon = df["longitude"].to_numpy(dtype="float64")
+    t = _acq_minutes(df)
+    frp = df["frp"].to_numpy(dtype="float64")
+
+    if "source" in df.columns:
+        codes, names = pd.factorize(df["source"].astype(object), sort=True)
+    else:
+        codes, names = np.zeros(n, dtype="int64"), np.array(["unknown"], dtype=object)
+
+    # Ô lưới đủ lớn theo cả kinh độ (lấy cos ở vĩ độ lớn nhất)
+    max_lat = np.radians(min(np.abs(lat).max(), 89.0))
+    cell_deg = distance_m / (EARTH_RADIUS_M * np.radians(1.0) * np.cos(max_lat))
+
+    cells = pd.DataFrame(
+        {
+            "ix": np.floor(lon / cell_deg).astype("int64"),
+            "iy": np.floor(lat / cell_deg).astype("int64"),
+            "it": t // max(int(time_window_min), 1),
+            "row": np.arange(n),
+        }
+    )
+    keys = ["ix", "iy", "it"]
+
+    # Nửa số ô láng giềng (+ chính ô đó) là đủ vì quan hệ đối xứng
+    offsets = [
+        (dx, dy, dt)
+        for dx in (-1, 0, 1)
+        for dy in (-1, 0, 1)
+        for dt in (-1, 0, 1)
+        if (dx, dy, dt) >= (0, 0, 0)
+    ]
+
+    left_parts, right_parts = [], []
+    for dx, dy, dt in offsets:
+        shifted = cells.assign(ix=cells.ix + dx, iy=cells.iy + dy, it=cells.it + dt)
+        pairs = shifted.merge(cells, on=keys, suffixes=("_a", "_b"))
+        i = pairs["row_a"].to_numpy()
+        j = pairs["row_b"].to_numpy()
+        if (dx, dy, dt) == (0, 0, 0):
+            keep = i < j
+            i, j = i[keep], j[keep]
+
+        close = (
+            (codes[i] != codes[j])
+            & (np.abs(t[i] - t[j]) <= time_window_min)
+            & (_haversine_m(lat[i], lon[i], lat[j], lon[j]) <= distance_m)
         )
+        left_parts.append(i[close])
+        right_parts.append(j[close])
+
+    # Danh sách kề (cả 2 chiều), mỗi điểm xếp láng giềng theo khoảng cách tăng dần
+    left = np.concatenate(left_parts + right_parts)
+    right = np.concatenate(right_parts + left_parts)
+    dist = _haversine_m(lat[left], lon[left], lat[right], lon[right])
+    order = np.lexsort((dist, left))
+    neighbors = right[order].tolist()
+    bounds = np.searchsorted(left[order], np.arange(n + 1)).tolist()
+
+    # Neo theo FRP giảm dần: mỗi neo nhận láng giềng gần nhất chưa gộp của từng nguồn khác
+    labels = [-1] * n
+    codes_list = codes.tolist()
+    for a in np.argsort(-frp, kind="stable").tolist():
+        if labels[a] >= 0:
+            continue
+        labels[a] = a
+        lo, hi = bounds[a], bounds[a + 1]
+        if lo == hi:
+            continue
+        used = {codes_list[a]}
+        for b in neighbors[lo:hi]:
+            if labels[b] < 0 and codes_list[b] not in used:
+                labels[b] = a
+                used.add(codes_list[b])
+    labels = np.asarray(labels, dtype="int64")
+
+    # Tập nguồn của mỗi cụm dạng bitmask (chỉ vài nguồn) → tránh groupby từng cụm
+    masks = np.zeros(n, dtype="int64")
+    np.bitwise_or.at(masks, labels, np.left_shift(1, np.maximum(codes, 0)))
+    counts = np.bincount(labels, minlength=n)
+
+    # Neo của mỗi cụm chính là bản ghi FRP cao nhất
+    first = np.unique(labels)
+
+    result = df.iloc[first].reset_index(drop=True)
+    kept = labels[first]
+    mask_sources = {
+        m: [name for b, name in enumerate(names) if m >> b & 1]
+        for m in np.unique(masks[kept]).tolist()
+    }
+    result["sources"] = [mask_sources[m] for m in masks[kept].tolist()]
+    result["n_detections"] = counts[kept]
+
+    print(f"🧹 Dedup: {n} → {len(result)} hotspots")
+    return result
+
+
+def hotspots_to_records(df):
+    """Chuyển DataFrame điểm nóng → list dict cho API (chỉ ở bước serialize cuối)"""
+    keys = list(HOTSPOT_API_FIELDS)
+    keys += [k for k in HOTSPOT_API_OPTIONAL_FIELDS if k in df.columns]
+    fields = {**HOTSPOT_API_FIELDS, **HOTSPOT_API_OPTIONAL_FIELDS}
+    columns = [df[fields[k]].tolist() for k in keys]
+    return [dict(zip(keys, values)) for values in zip(*columns)]
+
+
+def update_hotspot_index(df, fetched_at=None):
+    """Dựng lại BallTree (haversine) khi snapshot điểm nóng thay đổi"""
+    global hotspot_index
+    coords = np.radians(df[["latitude", "longitude"]].to_numpy(dtype="float64"))
+    hotspot_index = {
+        "df": df.reset_index(drop=True),
+        "tree": BallTree(coords, metric="haversine") if len(df) else None,
+        "built_at": fetched_at or time.time(),
+    }
+    print(f"🌲 Hotspot index: {len(df)} points")
+    return hotspot_index
 
-        gdf_vn = gpd.sjoin(gdf, vn_map, how="inner", predicate="within")
-        gdf_vn = gdf_vn.rename(columns={"NAME_1": "province"})
 
-        print(f"🇻🇳 {len(df)} → {len(gdf_vn)} hotspots in VN")
+def get_hotspot_index():
+    """Snapshot hôm nay từ cache FIRMS; chỉ dựng lại cây khi snapshot đổi"""
+    df, meta = get_firms_hotspots(1)
+    if hotspot_index is None or hotspot_index["built_at"] != meta["fetched_at"]:
+        return update_hotspot_index(df, meta["fetched_at"])
+    return hotspot_index
 
-        result = pd.DataFrame(gdf_vn.drop(columns="geometry"))
-        return result.to_dict(orient="records")
 
-    except Exception as e:
-        print(f"⚠️ Filter error: {e}")
-        df["province"] = "Unknown"
-        return df.to_dict(orient="records")
+def query_nearby_hotspots(index, lats, lons, k=5, radius_km=None):
+    """
+    Tìm điểm nóng lân cận cho 1 lô điểm
+
+    - radius_km=None: k điểm gần nhất
+    - radius_km: mọi điểm trong bán kính (sắp theo khoảng cách, tối đa k nếu có k)
+    Trả về list (mỗi điểm truy vấn) các DataFrame có thêm cột distance_km.
+    """
+    n = len(lats)
+    df = index["df"]
+    if index["tree"] is None or n == 0:
+        return [df.iloc[:0].assign(distance_km=[]) for _ in range(n)]
+
+    points = np.radians(np.column_stack([lats, lons]).astype("float64"))
+    earth_km = EARTH_RADIUS_M / 1000
+
+    if radius_km is None:
+        dist, idx = index["tree"].query(points, k=min(k, len(df)))
+    else:
+        idx, dist = index["tree"].query_radius(
+            points, r=radius_km / earth_km, return_distance=True, sort_results=True
+        )
+        if k is not None:
+            idx = [i[:k] for i in idx]
+            dist = [d[:k] for d in dist]
+
+    return [
+        df.iloc[i].assign(distance_km=d * earth_km).reset_index(drop=True)
+        for i, d in zip(idx, dist)
+    ]
+
+
+def nearby_fire_stats(nearby):
+    """Thống kê điểm nóng lân cận làm ngữ cảnh cho dự báo"""
+    if nearby.empty:
+        return {"count": 0}
+
+    return {
+        "count": int(len(nearby)),
+        "nearest_km": round(float(nearby["distance_km"].min()), 3),
+        "frp_mean": float(nearby["frp"].mean()),
+        "frp_max": float(nearby["frp"].max()),
+        "bright_ti5_mean": float(nearby["bright_ti5"].mean()),
+        "scan_mean": float(nearby["scan"].mean()),
+        "track_mean": float(nearby["track"].mean()),
+    }
+
+
+def _local_today():
+    """Ngày hiện tại theo giờ Việt Nam (Open-Meteo trả theo Asia/Ho_Chi_Minh)"""
+    return datetime.now(VN_TZ).date()
 
 
-def get_weather_daily(lat, lon):
-    """Get weather data"""
+def _fetch_weather_series(lat, lon):
+    """Gọi Open-Meteo: 30 ngày quá khứ + ngày dự báo (raise khi lỗi)"""
     params = {
         "latitude": lat,
         "longitude": lon,
-        "daily": [
-            "temperature_2m_max",
-            "relative_humidity_2m_max",
-            "precipitation_sum",
-            "wind_speed_10m_max",
-            "shortwave_radiation_sum",
-        ],
+        "daily": list(WEATHER_DAILY_VARIABLES),
         "timezone": "Asia/Ho_Chi_Minh",
         "past_days": 30,
+        "forecast_days": WEATHER_FORECAST_DAYS,
     }
 
-    try:
-        resp = requests.get(OPEN_METEO_URL, params=params, timeout=10).json()
-        daily = resp.get("daily", {})
-
-        if not daily:
-            return None
-
-        precip_list = daily.get("precipitation_sum", [])
-
-        return {
-            "Tmax_C": daily.get("temperature_2m_max", [])[-1],
-            "RHmax_pct": daily.get("relative_humidity_2m_max", [])[-1],
-            "Precip_sum_mm": precip_list[-1] if precip_list else 0.0,
-            "Precip_sum_7d": (
-                sum(precip_list[-7:]) if len(precip_list) >= 7 else sum(precip_list)
-            ),
-            "Precip_sum_30d": (
-                sum(precip_list[-30:]) if len(precip_list) >= 30 else sum(precip_list)
-            ),
-            "Wind_max_kmh": daily.get("wind_speed_10m_max", [])[-1],
-            "Solar_rad_J_m2": daily.get("shortwave_radiation_sum", [])[-1],
-        }
+    resp = requests.get(OPEN_METEO_URL, params=params, timeout=WEATHER_TIMEOUT)
+    resp.raise_for_status()
+    daily = resp.json().get("daily", {})
 
-    except Exception as e:
-        print(f"❌ Weather: {e}")
-        return None
+    if not daily or not daily.get("time"):
+        raise ValueError("Open-Meteo: empty daily data")
+
+    return daily
+
+
+def weather_features(daily, dates):
+    """
+    Feature thời tiết cho từng ngày mục tiêu từ chuỗi quá khứ + dự báo
+
+    Precip_sum_7d / Precip_sum_30d là tổng trượt (gồm cả ngày đó) trên chuỗi ghép.
+    Ngày ngoài chuỗi bị bỏ qua.
+    """
+    series = pd.DataFrame(daily).rename(columns=WEATHER_DAILY_VARIABLES)
+    series.index = pd.to_datetime(series.pop("time"))
+    series = series.astype("float64")
+
+    precip = series["Precip_sum_mm"].fillna(0.0)
+    features = series.ffill().bfill()
+    features["Precip_sum_mm"] = precip
+    features["Precip_sum_7d"] = precip.rolling(7, min_periods=1).sum().round(2)
+    features["Precip_sum_30d"] = precip.rolling(30, min_periods=1).sum().round(2)
+
+    features = features.reindex(pd.to_datetime(list(dates))).dropna()
+    return features[WEATHER_FEATURES]
+
+
+def _weather_series_cached(lat, lon):
+    """Chuỗi thời tiết qua cache stale-while-revalidate (theo ô ~0.1°)"""
+    lat = round(float(lat), WEATHER_COORD_DECIMALS)
+    lon = round(float(lon), WEATHER_COORD_DECIMALS)
+    return weather_cache.get((lat, lon), lambda: _fetch_weather_series(lat, lon))
+
+
+def get_weather_with_meta(lat, lon):
+    """
+    Thời tiết hôm nay qua cache stale-while-revalidate
+
+    Trả (weather, meta); raise UpstreamUnavailable nếu không có dữ liệu nào.
+    """
+    daily, meta = _weather_series_cached(lat, lon)
+    today = weather_features(daily, [_local_today()])
+    if today.empty:
+        raise ValueError("Open-Meteo: no data for today")
+
+    return dict(zip(WEATHER_FEATURES, today.iloc[0].tolist())), meta
+
+
+def get_weather_forecast(lat, lon, days):
+    """
+    Thời tiết cho `days` ngày từ hôm nay (1 lần gọi upstream, dùng chung cache)
+
+    Trả (DataFrame index = ngày, meta).
+    """
+    daily, meta = _weather_series_cached(lat, lon)
+    today = _local_today()
+    dates = [today + timedelta(days=i) for i in range(days)]
+    return weather_features(daily, dates), meta
 
 
 def preprocess_input(input_dict, preprocessors):
     """Preprocess input"""
-    df = pd.DataFrame([input_dict])
+    return preprocess_batch(pd.DataFrame([input_dict]), preprocessors)
+
+
+def preprocess_batch(df, preprocessors, dates=None):
+    """
+    Preprocess nhiều dòng cùng lúc (vector hóa)
+
+    dates: ngày của từng dòng cho day_sin/day_cos (mặc định: hôm nay, giờ Việt Nam
+    như _local_today() → khớp nhánh dự báo nhiều ngày)
+    """
+    df = df.copy()
 
     # Features
     if "scan" not in df.columns:
@@ -272,12 +925,15 @@ def preprocess_input(input_dict, preprocessors):
     df["rain_ratio_7d_30d"] = df["Precip_sum_7d"] / (df["Precip_sum_30d"] + 1e-5)
 
     # Cyclic
-    doy = datetime.now().timetuple().tm_yday
+    if dates is None:
+        doy = _local_today().timetuple().tm_yday
+    else:
+        doy = pd.DatetimeIndex(pd.to_datetime(dates)).dayofyear.to_numpy()
     df["day_sin"] = np.sin(2 * np.pi * doy / 365)
     df["day_cos"] = np.cos(2 * np.pi * doy / 365)
 
     # Daynight
-    if "daynight" in df.columns and isinstance(df["daynight"].iloc[0], str):
+    if "daynight" in df.columns and not pd.api.types.is_numeric_dtype(df["daynight"]):
         df["daynight"] = df["daynight"].map({"D": 1, "N": 0})
 
     # Preprocessing
@@ -335,8 +991,44 @@ def preprocess_input(input_dict, preprocessors):
         ],
     )
 
-    final = pd.DataFrame()
-    for col in expected:
-        final[col] = df[col] if col in df.columns else 0.0
+    return df.reindex(columns=expected, fill_value=0.0)
+
+
+def model_version(path):
+    """Phiên bản model = hash nội dung file (đổi model → cache SHAP tự mất hiệu lực)"""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
 
-    return final
+def explain_batch(model, X, version):
+    """
+    Đóng góp từng feature (CatBoost tree SHAP, đơn vị log-odds) cho 1 lô dòng
+
+    Chỉ các dòng chưa có trong cache được tính, trong 1 lần gọi
+    get_feature_importance(type="ShapValues"). Trả (contributions, base_values)
+    với contributions là DataFrame cột = X.columns.
+    Kết quả được gom đủ trước khi cập nhật / cắt cache (lô > SHAP_CACHE_MAX vẫn đúng).
+    """
+    values = np.ascontiguousarray(X.to_numpy(dtype="float64"))
+    keys = [(version, row.tobytes()) for row in values]
+    with shap_lock:
+        found = [shap_cache.get(key) for key in keys]
+    missing = [i for i, row in enumerate(found) if row is None]
+
+    # Tính SHAP ngoài lock (chậm), rồi mới ghi vào cache
+    if missing:
+        pool = Pool(X.iloc[missing].reset_index(drop=True))
+        shap = model.get_feature_importance(data=pool, type="ShapValues")
+        for i, row in zip(missing, shap):
+            found[i] = row
+
+    rows = np.vstack(found)
+    with shap_lock:
+        for key, row in zip(keys, found):
+            shap_cache[key] = row
+            shap_cache.move_to_end(key)
+        while len(shap_cache) > SHAP_CACHE_MAX:
+            shap_cache.popitem(last=False)
+
+    contributions = pd.DataFrame(rows[:, :-1], columns=list(X.columns), index=X.index)
+    return contributions, rows[:, -1]